@@ -0,0 +1,259 @@
+"""Headless benchmarks for the hot paths of world generation and drawing.
+
+Runs with the SDL dummy video driver, so no window is needed, and prints
+the results as JSON:
+
+    python benchmark.py --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# Keep the pygame banner out of the JSON
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from globals import SCREEN_SIZE, CHUNK_SIZE
+
+def timed(func, repeat: int) -> list[float]:
+    """Call func `repeat` times and return how long each call took in seconds"""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        times.append(time.perf_counter() - start)
+    return times
+
+def summarize(times: list[float], items_per_call: int = 1) -> dict:
+    total = sum(times)
+    return {
+        "calls": len(times),
+        "mean_ms": statistics.mean(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "max_ms": max(times) * 1000,
+        "per_sec": len(times) * items_per_call / total if total > 0 else None,
+    }
+
+def chunk_positions(count: int) -> list[pygame.Vector2]:
+    """`count` distinct chunk positions in a square around the origin"""
+    side = max(1, int(count ** 0.5 + 0.999))
+    return [pygame.Vector2((i % side) * CHUNK_SIZE[0], (i // side) * CHUNK_SIZE[1]) for i in range(count)]
+
+def bench_generation(world, chunks: int) -> dict:
+    positions = chunk_positions(chunks)
+    results = {}
+
+    for backend in ("numpy", "scalar"):
+        world.heightmap_backend = backend
+        times = timed(lambda i: world.generate_heightmap(positions[i]), len(positions))
+        results[f"generate_heightmap_{backend}"] = summarize(times)
+    world.heightmap_backend = "numpy"
+
+    heights = [world.generate_heightmap(pos) for pos in positions]
+    fields = world.fields
+    humidity = [fields.get("humidity", pos) for pos in positions]
+    temperature = [fields.get("temperature", pos) for pos in positions]
+    times = timed(lambda i: world.generate_tiles(heights[i], humidity[i], temperature[i]), len(positions))
+    results["generate_tiles"] = summarize(times)
+
+    # Every layer of a chunk, starting from an empty cache
+    def generate_fields(i):
+        if i == 0:
+            fields.clear()
+        for layer in fields.layers():
+            fields.get(layer, positions[i])
+    results["generate_fields"] = summarize(timed(generate_fields, len(positions)))
+
+    # Regions no chunk has needed yet, so none of them are cached
+    from world import world_rivers
+    rivers = world_rivers(world.rand_seed_x, world.rand_seed_y, world.thermal_erosion_iterations,
+                          world.hydraulic_erosion_iterations)
+    times = timed(lambda i: rivers.region((i * rivers.region_size[0], -100 * rivers.region_size[1])), 2)
+    results["generate_river_region"] = summarize(times, rivers.region_size[0] * rivers.region_size[1])
+
+    new_chunks = [world.generate_chunk(pos, heights[i]) for i, pos in enumerate(positions)]
+    def render(i):
+        new_chunks[i].isdirty = True
+        new_chunks[i].render()
+    results["tile_chunk_render"] = summarize(timed(render, len(new_chunks)))
+
+    return results
+
+def bench_river_seams(world) -> dict:
+    """How many river tiles come out different when a square around the
+    corner of four regions is worked out a region at a time, compared to
+    working it out in one go with twice the halo. Too little halo shows up
+    here as rivers ending at region edges, see RiverNetwork.
+    """
+    from world import world_rivers
+    from world_generation.rivers import RiverNetwork
+
+    rivers = world_rivers(world.rand_seed_x, world.rand_seed_y, world.thermal_erosion_iterations,
+                          world.hydraulic_erosion_iterations)
+    size = rivers.region_size
+    position = (-size[0] // 2, -size[1] // 2)
+
+    # Fresh networks, so nothing comes from the cache
+    regions = RiverNetwork(rivers.heights_func, rivers.min_flow, size, rivers.halo)
+    start = time.perf_counter()
+    separate = regions.mask(position, size)
+    separate_time = time.perf_counter() - start
+
+    whole = RiverNetwork(rivers.heights_func, rivers.min_flow, size, 2 * rivers.halo)
+    start = time.perf_counter()
+    reference = whole.compute_region(position)
+    whole_time = time.perf_counter() - start
+
+    river_tiles = int(reference.sum())
+    differ = int((separate != reference).sum())
+    return {
+        "halo": rivers.halo,
+        "river_tiles": river_tiles,
+        "tiles_differ": differ,
+        "fraction_differ": differ / river_tiles if river_tiles else 0.0,
+        "regions_ms": separate_time * 1000,
+        "reference_ms": whole_time * 1000,
+    }
+
+def bench_erosion(world, map_size: int, iterations: int, hydraulic_iterations: int) -> dict:
+    from world import World
+    from world_generation.heightmap import generate_eroded_heightmap
+
+    size = (map_size, map_size)
+    heights = world.generate_heightmap((0, 0), size)
+    height_map = [list(row) for row in heights]
+    results = {}
+
+    times = timed(lambda i: World.thermal_erosion(height_map, iterations), 1)
+    results["thermal_erosion"] = summarize(times, map_size * map_size * iterations)
+    results["thermal_erosion"]["map_size"] = map_size
+    results["thermal_erosion"]["iterations"] = iterations
+
+    height_map = [list(row) for row in heights]
+    times = timed(lambda i: World.hydraulic_erosion(height_map, hydraulic_iterations), 1)
+    results["hydraulic_erosion"] = summarize(times, map_size * map_size * hydraulic_iterations)
+    results["hydraulic_erosion"]["map_size"] = map_size
+    results["hydraulic_erosion"]["iterations"] = hydraulic_iterations
+
+    # Chunk-local erosion including the overlap it has to generate
+    positions = chunk_positions(16)
+    times = timed(lambda i: generate_eroded_heightmap(positions[i], CHUNK_SIZE, world.rand_seed_x, world.rand_seed_y, iterations), len(positions))
+    results["thermal_erosion_chunk"] = summarize(times)
+    results["thermal_erosion_chunk"]["iterations"] = iterations
+
+    height_map = [list(row) for row in heights]
+    # Keep at least one water tile so every distance is finite
+    height_map[0][0] = 0.0
+    times = timed(lambda i: World.calculate_humidity_map_ff(height_map), 1)
+    results["calculate_humidity_map_ff"] = summarize(times, map_size * map_size)
+    results["calculate_humidity_map_ff"]["map_size"] = map_size
+
+    return results
+
+def bench_frames(world, screen, frames: int) -> dict:
+    """Pan the camera to the right, then zoom out and back in, the way
+    main.run would with the mouse at the edge of the screen and the wheel.
+    """
+    from profiler import profiler
+
+    profiler.reset()
+    profiler.window = frames
+    times = []
+    chunks_before = len(world.chunks)
+    for frame in range(frames):
+        start = time.perf_counter()
+
+        world.camera.position.x += 4 / world.camera.scale
+        phase = frame / frames
+        if 0.5 <= phase < 0.75:
+            world.camera.scale *= 0.95
+        elif phase >= 0.75:
+            world.camera.scale *= 1.05
+
+        world.update(1 / 60)
+        screen.fill((0, 0, 0))
+        world.draw(screen)
+
+        times.append(time.perf_counter() - start)
+        profiler.end_frame()
+
+    ordered = sorted(times)
+    result = summarize(times)
+    result["p95_ms"] = ordered[int(len(ordered) * 0.95) - 1] * 1000
+    result["frames_over_16ms"] = sum(t > 1 / 60 for t in times)
+    result["chunks_generated"] = len(world.chunks) - chunks_before
+    # Per stage timers and counters, see profiler.py
+    result["stages"] = profiler.report()
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1, help="world seed, fixed so runs are comparable")
+    parser.add_argument("--chunks", type=int, default=64, help="chunks to generate and render")
+    parser.add_argument("--erosion-size", type=int, default=64, help="side of the map used for erosion and humidity")
+    parser.add_argument("--erosion-iterations", type=int, default=5)
+    parser.add_argument("--hydraulic-iterations", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=300, help="frames of scripted camera movement")
+    parser.add_argument("--async-generation", action="store_true", help="generate chunks in worker processes during the frame benchmark")
+    parser.add_argument("--viewport", action="store_true", help="compose the frame benchmark through a persistent viewport surface")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the peak of Python allocations (slows everything down)")
+    parser.add_argument("--river-seams", action="store_true", help="also check that rivers carry on across region edges (slow)")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+
+    from world import World
+
+    if args.trace_memory:
+        tracemalloc.start()
+    results = {
+        "python": sys.version.split()[0],
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "seed": args.seed,
+    }
+
+    world = World(seed=args.seed, async_generation=False)
+    results.update(bench_generation(world, args.chunks))
+    results.update(bench_erosion(world, args.erosion_size, args.erosion_iterations, args.hydraulic_iterations))
+    if args.river_seams:
+        results["river_seams"] = bench_river_seams(world)
+    world.close()
+
+    world = World(seed=args.seed, async_generation=args.async_generation)
+    if args.viewport:
+        from viewport import Viewport
+        world.viewport = Viewport()
+    results["frame"] = bench_frames(world, screen, args.frames)
+    world.close()
+
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["peak_traced_mb"] = peak / 1024 / 1024
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = max_rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    pygame.quit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+import sys
+import time
+
+class WorkerPool:
+    """Worker processes that one or more ChunkGenerators hand their work to,
+    so different kinds of work share the cores instead of each kind starting
+    processes of its own. The processes are started when the first work
+    comes in, and started again if one of them crashed and took the others
+    down with it.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.executor = None
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        if self.executor is not None:
+            try:
+                return self.executor.submit(func, *args, **kwargs)
+            except BrokenProcessPool:
+                # Its work fails with BrokenProcessPool, the generators queue it again
+                self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(self.max_workers)
+        return self.executor.submit(func, *args, **kwargs)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+class ChunkGenerator:
+    """Runs chunk generation in a pool of worker processes so the main loop
+    never has to wait on the noise functions.
+
+    Requests are kept in a queue ordered by priority (lower goes first) and
+    only a few at a time are handed to the pool, so the priorities can still
+    change, or the request can be cancelled, while it waits. Finished
+    results are picked up on the main thread with `poll`.
+
+    A request that fails is retried up to `max_retries` times before it is
+    given up on for FAILED_RETRY_SECONDS, and a crashed pool is replaced, so
+    a worker going wrong never takes the main loop down with it. Work that
+    was cancelled after a worker started on it is kept, the next request for
+    that key gets it without starting over.
+
+    Generators can share the processes of a WorkerPool. Each one still hands
+    the pool at most max_in_flight requests at a time.
+    """
+
+    # Finished results of cancelled requests kept for when they are asked for again
+    MAX_SPARE_RESULTS = 64
+    # How long a request that failed too often is refused before it is tried again
+    FAILED_RETRY_SECONDS = 30.0
+
+    def __init__(self, generate_func, generate_args: tuple = (), max_workers: int | None = None, max_retries: int = 3,
+                 pool: WorkerPool | None = None):
+        # generate_func has to be a module level function so it can be
+        # pickled. It is called as generate_func(key, *generate_args, **kwargs),
+        # with the kwargs given to request
+        self.generate_func = generate_func
+        self.generate_args = generate_args
+        # Without a pool to share, the generator starts its own with max_workers
+        self.owns_pool = pool is None
+        self.pool = pool or WorkerPool(max_workers)
+        self.max_workers = self.pool.max_workers
+        # Keep the workers busy without committing too far ahead
+        self.max_in_flight = self.max_workers * 2
+
+        self.max_retries = max_retries
+
+        self.queued = {} # key -> priority
+        self.kwargs = {} # key -> extra keyword arguments of a queued or in flight request
+        self.in_flight = {} # key -> (Future, priority)
+        self.ready = {} # key -> result that poll hasn't handed out yet
+        self.abandoned = {} # key -> Future of a cancelled request a worker is still busy with
+        self.spare = OrderedDict() # key -> result of a cancelled request, least recently finished first
+        self.failures = {} # key -> how many times it failed in a row
+        self.failed = {} # key -> when it was given up on, requests for it are refused for a while
+
+    def is_pending(self, key) -> bool:
+        return key in self.queued or key in self.in_flight or key in self.ready
+
+    def pending_keys(self) -> list:
+        return list(self.queued) + list(self.in_flight) + list(self.ready)
+
+    def is_failed(self, key) -> bool:
+        """Whether `key` failed too often and is refused for now"""
+        given_up = self.failed.get(key)
+        if given_up is None:
+            return False
+        if time.monotonic() - given_up >= ChunkGenerator.FAILED_RETRY_SECONDS:
+            del self.failed[key]
+            return False
+        return True
+
+    def request(self, key, priority=0.0, kwargs: dict | None = None) -> bool:
+        """Queue `key` for generation, or update its priority if it is still
+        waiting in the queue. Priorities only need to be comparable with each
+        other, like numbers or tuples of numbers. `kwargs` are passed on to
+        generate_func for just this key.
+
+        Returns False if `key` failed too often and is refused for now, see
+        is_failed. It can be requested again once FAILED_RETRY_SECONDS passed.
+        """
+        if self.is_failed(key):
+            return False
+        if key in self.in_flight or key in self.ready:
+            return True
+        if key in self.spare:
+            self.ready[key] = self.spare.pop(key)
+        elif key in self.abandoned:
+            self.in_flight[key] = (self.abandoned.pop(key), priority)
+        else:
+            self.queued[key] = priority
+            self.kwargs[key] = kwargs or {}
+        return True
+
+    def cancel(self, key) -> None:
+        """Drop a request. Work that a worker has already started can't be
+        stopped, so it is left to finish and its result kept in case the key
+        is requested again.
+        """
+        self.queued.pop(key, None)
+        self.kwargs.pop(key, None)
+        if key in self.ready:
+            self._keep_spare(key, self.ready.pop(key))
+        future, _ = self.in_flight.pop(key, (None, None))
+        if future is not None and not future.cancel():
+            self.abandoned[key] = future
+
+    def poll(self, budget: int) -> list:
+        """Return up to `budget` finished (key, result) pairs and hand more
+        queued requests to the workers.
+        """
+        for key, future in list(self.abandoned.items()):
+            if future.done():
+                del self.abandoned[key]
+                if future.exception() is None:
+                    self._keep_spare(key, future.result())
+
+        finished = []
+        for key in list(self.ready)[:budget]:
+            finished.append((key, self.ready.pop(key)))
+
+        for key, (future, priority) in list(self.in_flight.items()):
+            if len(finished) >= budget:
+                break
+            # A crashed pool puts everything it had back in the queue
+            if future.done() and key in self.in_flight:
+                del self.in_flight[key]
+                error = future.exception()
+                if error is None:
+                    self.failures.pop(key, None)
+                    self.kwargs.pop(key, None)
+                    finished.append((key, future.result()))
+                else:
+                    self._failed(key, priority, error)
+
+        self._submit()
+        return finished
+
+    def _failed(self, key, priority, error: BaseException) -> None:
+        """Queue a failed request again, unless it keeps failing"""
+        if isinstance(error, BrokenProcessPool):
+            # A worker died and took the pool with it, the next submit starts a
+            # new one. The rest of the work that went down with it goes back in
+            # the queue without counting as a failure
+            for other_key, (other_future, other_priority) in list(self.in_flight.items()):
+                if other_future.done() and isinstance(other_future.exception(), BrokenProcessPool):
+                    del self.in_flight[other_key]
+                    self.queued[other_key] = other_priority
+
+        failures = self.failures.get(key, 0) + 1
+        if failures > self.max_retries:
+            print(f"Generating {key} failed {failures} times, giving up for {ChunkGenerator.FAILED_RETRY_SECONDS:.0f}s: {error!r}",
+                  file=sys.stderr, flush=True)
+            self.failures.pop(key, None)
+            self.kwargs.pop(key, None)
+            self.failed[key] = time.monotonic()
+            return
+        print(f"Generating {key} failed, retrying: {error!r}", file=sys.stderr, flush=True)
+        self.failures[key] = failures
+        self.queued[key] = priority
+
+    def _keep_spare(self, key, result) -> None:
+        self.spare[key] = result
+        self.spare.move_to_end(key)
+        while len(self.spare) > ChunkGenerator.MAX_SPARE_RESULTS:
+            self.spare.popitem(last=False)
+
+    def _submit(self) -> None:
+        free_slots = self.max_in_flight - len(self.in_flight)
+        if free_slots <= 0 or not self.queued:
+            return
+
+        for key in sorted(self.queued, key=self.queued.get)[:free_slots]:
+            self.in_flight[key] = (self.pool.submit(self.generate_func, key, *self.generate_args, **self.kwargs.get(key, {})),
+                                  self.queued.pop(key))
+
+    def shutdown(self) -> None:
+        """Drop all requests. A pool of its own is stopped, a shared one is
+        left to whoever made it
+        """
+        in_flight = list(self.in_flight.values())
+        self.queued.clear()
+        self.kwargs.clear()
+        self.in_flight.clear()
+        self.ready.clear()
+        self.abandoned.clear()
+        self.spare.clear()
+        self.failures.clear()
+        self.failed.clear()
+        if self.owns_pool:
+            self.pool.shutdown()
+        else:
+            for future, _ in in_flight:
+                future.cancel()
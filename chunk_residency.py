@@ -0,0 +1,83 @@
+from globals import CHUNK_SIZE
+
+class ChunkResidency:
+    """Keeps the memory held by the world's chunks under a budget.
+
+    When the chunks use more than `budget_bytes`, the chunks furthest from
+    the camera that aren't on screen are downgraded in steps: first their
+    scaled surface is dropped, then their rendered surface, and finally the
+    whole chunk is evicted from the world. Surfaces are rendered again when
+    the chunk is drawn, evicted chunks are loaded or generated again by
+    World.update once they are back in view. Chunks changed with
+    World.set_tile are only evicted if they can be loaded from the store.
+
+    resident_bytes is a running total, kept up to date by the chunks as
+    their surfaces come and go, so checking the budget every frame doesn't
+    cost more the more chunks are loaded.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.resident_bytes = 0
+        self._usage = {} # chunk key -> bytes it held when last tracked
+
+    def add(self, chunk) -> None:
+        """Start counting a chunk that was added to the world, replacing any
+        chunk that had the same key
+        """
+        self.resident_bytes -= self._usage.get(chunk.key, 0)
+        self._usage[chunk.key] = chunk.memory_usage()
+        self.resident_bytes += self._usage[chunk.key]
+
+    def track(self, chunk) -> None:
+        """Count the memory of a chunk again after it changed. Chunks that
+        aren't in the world anymore are ignored.
+        """
+        if chunk.key not in self._usage:
+            return
+        usage = chunk.memory_usage()
+        self.resident_bytes += usage - self._usage[chunk.key]
+        self._usage[chunk.key] = usage
+
+    def remove(self, key) -> None:
+        self.resident_bytes -= self._usage.pop(key, 0)
+
+    def enforce(self, world) -> None:
+        """Downgrade chunks until they fit in the budget"""
+        if self.resident_bytes <= self.budget_bytes:
+            return
+
+        camera_pos = world.camera.position
+        visible = world.visible_chunk_range()
+        def distance(pos):
+            return (pos[0] + CHUNK_SIZE[0] / 2 - camera_pos.x) ** 2 + (pos[1] + CHUNK_SIZE[1] / 2 - camera_pos.y) ** 2
+
+        # Furthest first. Visible chunks would just be recreated next frame
+        candidates = sorted((pos for pos in world.chunks if not world.chunk_in_range(pos, visible)), key=distance, reverse=True)
+
+        for downgrade in (ChunkResidency.drop_scaled_surface, ChunkResidency.drop_surface, ChunkResidency.evict):
+            for pos in candidates:
+                if self.resident_bytes <= self.budget_bytes:
+                    return
+                if pos not in world.chunks:
+                    continue
+
+                # The chunk tracks its own memory as it lets go of things
+                downgrade(world, pos)
+
+    @staticmethod
+    def drop_scaled_surface(world, pos) -> None:
+        world.chunks[pos].drop_scaled_surface()
+
+    @staticmethod
+    def drop_surface(world, pos) -> None:
+        world.chunks[pos].drop_surface()
+
+    @staticmethod
+    def evict(world, pos) -> None:
+        # Without a chunk store the changes made to a chunk would be lost
+        if world.chunks[pos].modified and world.chunk_store is None:
+            return
+        del world.chunks[pos]
+        world.chunk_residency.remove(pos)
+        world.mipmaps.invalidate(pos)
@@ -0,0 +1,145 @@
+from collections import OrderedDict
+import hashlib
+import os
+import sys
+import numpy as np
+
+from globals import CHUNK_SIZE
+
+def chunk_hash(seed, chunk_pos: tuple[int, int], heights, tile_ids) -> bytes:
+    """Stable hash of a chunk's contents. The same seed and position always
+    produce the same chunk, so the hash can be used to check that a saved or
+    cached chunk is intact and belongs where it is being used.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{seed}:{int(chunk_pos[0])}:{int(chunk_pos[1])}".encode())
+    # Heights are hashed at the precision they are saved with
+    digest.update(np.ascontiguousarray(heights, dtype="<f4").tobytes())
+    digest.update(np.ascontiguousarray(tile_ids, dtype=np.uint8).tobytes())
+    return digest.digest()
+
+class ChunkStore:
+    """Saves generated chunks to disk so they don't have to be generated
+    again.
+
+    Chunks are grouped into region files of REGION_SIZE x REGION_SIZE chunks.
+    Every region file is a .npy array of fixed size slots, one per chunk,
+    holding the heights and tile ids of that chunk. Region files are memory
+    mapped, so reading a chunk only touches the pages of its own slot.
+
+    Every seed gets its own directory, a chunk is only valid for the seed it
+    was generated with. Inside it every `generator`, a fingerprint of the
+    settings and code the chunks were generated with, gets a directory of
+    its own too, so changing how terrain is generated never mixes old chunks
+    in with new ones. Each slot also holds the chunk's chunk_hash, which is
+    checked when it is loaded.
+    """
+
+    REGION_SIZE = 32 # In chunks
+    MAX_OPEN_REGIONS = 16
+
+    SLOT_DTYPE = np.dtype([
+        ("present", np.uint8),
+        ("heights", np.float32, (CHUNK_SIZE[1], CHUNK_SIZE[0])),
+        ("tile_ids", np.uint8, (CHUNK_SIZE[1], CHUNK_SIZE[0])),
+        ("hash", np.uint8, (16,)),
+    ])
+
+    def __init__(self, path: str, seed, generator: str = ""):
+        self.seed = seed
+        self.generator = generator
+        self.path = os.path.join(path, str(seed), generator)
+        os.makedirs(self.path, exist_ok=True)
+        self._regions = OrderedDict() # region key -> memmap, least recently used first
+
+    @staticmethod
+    def get_region(chunk_pos: tuple[int, int]) -> tuple[tuple[int, int], tuple[int, int]]:
+        """Return the region a chunk belongs to, and the chunk's slot in it"""
+        chunk_x = int(chunk_pos[0]) // CHUNK_SIZE[0]
+        chunk_y = int(chunk_pos[1]) // CHUNK_SIZE[1]
+        region = (chunk_x // ChunkStore.REGION_SIZE, chunk_y // ChunkStore.REGION_SIZE)
+        slot = (chunk_y % ChunkStore.REGION_SIZE, chunk_x % ChunkStore.REGION_SIZE)
+        return region, slot
+
+    def region_path(self, region: tuple[int, int]) -> str:
+        return os.path.join(self.path, f"r.{region[0]}.{region[1]}.npy")
+
+    def _open_region(self, region: tuple[int, int], create: bool):
+        if region in self._regions:
+            self._regions.move_to_end(region)
+            return self._regions[region]
+
+        path = self.region_path(region)
+        slots = None
+        if os.path.exists(path):
+            slots = np.load(path, mmap_mode="r+")
+            if slots.dtype != ChunkStore.SLOT_DTYPE:
+                # Written by an older version. It may hold changes made by the
+                # player, so keep it around, the chunks will be generated again
+                del slots
+                slots = None
+                ChunkStore.move_aside(path)
+
+        if slots is None:
+            if not create:
+                return None
+            slots = np.lib.format.open_memmap(path, mode="w+", dtype=ChunkStore.SLOT_DTYPE,
+                                              shape=(ChunkStore.REGION_SIZE, ChunkStore.REGION_SIZE))
+
+        self._regions[region] = slots
+        if len(self._regions) > ChunkStore.MAX_OPEN_REGIONS:
+            _, oldest = self._regions.popitem(last=False)
+            oldest.flush()
+        return slots
+
+    @staticmethod
+    def move_aside(path: str) -> str:
+        """Rename a region file that can't be used anymore instead of deleting it"""
+        stem = path[:-len(".npy")]
+        number = 0
+        new_path = f"{stem}.old.npy"
+        while os.path.exists(new_path):
+            number += 1
+            new_path = f"{stem}.old{number}.npy"
+        os.replace(path, new_path)
+        print(f"Region file {path} has an old layout, moved it to {new_path}", file=sys.stderr, flush=True)
+        return new_path
+
+    def contains(self, chunk_pos: tuple[int, int]) -> bool:
+        region, slot = ChunkStore.get_region(chunk_pos)
+        slots = self._open_region(region, create=False)
+        return slots is not None and bool(slots["present"][slot])
+
+    def load(self, chunk_pos: tuple[int, int]) -> tuple[np.ndarray, np.ndarray] | None:
+        """Return (heights, tile_ids) of a saved chunk, or None if it hasn't
+        been saved or doesn't match its hash
+        """
+        region, slot = ChunkStore.get_region(chunk_pos)
+        slots = self._open_region(region, create=False)
+        if slots is None or not slots["present"][slot]:
+            return None
+
+        heights = np.array(slots["heights"][slot])
+        tile_ids = np.array(slots["tile_ids"][slot])
+        if chunk_hash(self.seed, chunk_pos, heights, tile_ids) != slots["hash"][slot].tobytes():
+            return None
+        return heights, tile_ids
+
+    def save(self, chunk_pos: tuple[int, int], heights, tile_ids, content_hash: bytes | None = None) -> None:
+        if content_hash is None:
+            content_hash = chunk_hash(self.seed, chunk_pos, heights, tile_ids)
+
+        region, slot = ChunkStore.get_region(chunk_pos)
+        slots = self._open_region(region, create=True)
+        slots["heights"][slot] = heights
+        slots["tile_ids"][slot] = tile_ids
+        slots["hash"][slot] = np.frombuffer(content_hash, dtype=np.uint8)
+        slots["present"][slot] = 1
+
+    def flush(self) -> None:
+        for slots in self._regions.values():
+            slots.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._regions.clear()
@@ -7,5 +7,67 @@ CHUNK_SIZE = (16, 16)
 
 WORLD_SCALE = 1.0 # WORLD_SCALE in meters
 
+# Seed the world is generated from. None picks a new random seed every start
+WORLD_SEED = None
+
+# "numpy" evaluates whole chunks at once, "scalar" evaluates one tile at a time
+HEIGHTMAP_BACKEND = "numpy"
+
+# Generate chunks in background worker processes instead of inside the frame
+ASYNC_CHUNK_GENERATION = True
+# How many finished chunks are turned into TileChunks each frame
+CHUNK_INTEGRATION_BUDGET = 4
+# Chunks the camera should reach within this many frames are generated ahead of time.
+# 0 disables prefetching. Only used with ASYNC_CHUNK_GENERATION
+PREFETCH_FRAMES = 30
+# Most chunks queued ahead of time at once
+PREFETCH_MAX_CHUNKS = 48
+# How quickly the camera velocity used for prefetching follows the real one, between 0 and 1
+PREFETCH_SMOOTHING = 0.3
+
+# Erosion iterations run on every generated chunk. 0 disables that kind of erosion.
+# Changing them changes the terrain, the chunk store keeps chunks generated with other settings apart
+THERMAL_EROSION_ITERATIONS = 0
+HYDRAULIC_EROSION_ITERATIONS = 0
+
+# Tiles this far from water or further are as dry as it gets. Water up to this
+# far into the neighboring chunks is taken into account
+HUMIDITY_DISTANCE = WORLD_SIZE[0] / 10
+# "manhattan" matches a flood fill, "euclidean" gives rounder shorelines
+HUMIDITY_METRIC = "manhattan"
+
+# Tiles with at least this many tiles draining through them become rivers. 0 disables rivers
+RIVER_MIN_FLOW = 400
+# Rivers are worked out for squares of this many chunks at a time, with RIVER_HALO
+# tiles of terrain around them so they carry on across the edges. With less than
+# about 128 tiles of halo rivers start to end at region edges, see benchmark.py
+RIVER_REGION_CHUNKS = 16
+RIVER_HALO = 128
+# River regions kept in memory by every process, each one takes 64 kilobytes
+RIVER_MAX_REGIONS = 64
+
+# Compose the chunks into a surface that is kept between frames, so panning only
+# draws the parts of the screen that scrolled into view
+VIEWPORT_BACKING = False
+
+# Below this zoom the world is drawn from low detail super chunks instead of chunks
+LOD_SCALE = 0.2
+# Width and height of a super chunk, in chunks. Super chunks have one pixel per tile
+LOD_CHUNKS = 8
+# Super chunks kept around once they are off screen
+LOD_MAX_SUPER_CHUNKS = 64
+
+# Directory generated chunks are saved to and loaded from. None disables saving
+CHUNK_STORE_PATH = None
+
+# Memory the chunks are allowed to use before far away chunks get freed, in bytes
+CHUNK_MEMORY_BUDGET = 256 * 1024 * 1024
+# Memory shared by the pre-scaled chunk surfaces used when zoomed out, in bytes
+MIPMAP_MEMORY_BUDGET = 64 * 1024 * 1024
+
 # DEBUG GLOBALS BELOW
-DRAW_CHUNK_OUTLINES = False
\ No newline at end of file
+DRAW_CHUNK_OUTLINES = False
+# Show the profiler overlay at startup. F3 toggles it
+SHOW_PROFILER = False
+# Seconds between dumps of the profiler stats to stdout. 0 disables them
+PROFILER_DUMP_INTERVAL = 0
\ No newline at end of file
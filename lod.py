@@ -0,0 +1,224 @@
+from math import ceil
+import pygame
+import numpy as np
+
+from camera import Camera
+from chunk_generator import ChunkGenerator, WorkerPool
+from tiles.tile_stamps import TileStamps
+from profiler import profiler
+
+from globals import SCREEN_SIZE, TILE_SIZE, CHUNK_SIZE, LOD_SCALE, LOD_CHUNKS, LOD_MAX_SUPER_CHUNKS, CHUNK_INTEGRATION_BUDGET
+
+class SuperChunk:
+    """Low detail version of a square of LOD_CHUNKS x LOD_CHUNKS chunks,
+    drawn with one pixel per tile in the average color of the tile.
+    """
+
+    def __init__(self, coordinate: pygame.Vector2, tile_ids: np.ndarray, shade: np.ndarray):
+        self.coordinate = coordinate # In tile coordinates, like TileChunk
+        self.key = (int(coordinate[0]), int(coordinate[1]))
+        self.tile_ids = tile_ids
+        self.shade = shade
+        self.surface = None
+        self.scaled_surface = None
+        self._last_scale = None
+
+    def memory_usage(self) -> int:
+        total = self.tile_ids.nbytes + self.shade.nbytes
+        for surface in (self.surface, self.scaled_surface):
+            if surface is not None:
+                total += surface.get_pitch() * surface.get_height()
+        return total
+
+    def render(self) -> None:
+        rows, cols = self.tile_ids.shape
+        self.surface = pygame.Surface((cols, rows))
+        with profiler.timer("lod_render"):
+            pygame.surfarray.blit_array(self.surface, TileStamps.average(self.tile_ids, self.shade))
+        self.scaled_surface = None
+
+    def screen_size(self, scale: float) -> tuple[int, int]:
+        rows, cols = self.tile_ids.shape
+        return (ceil(cols * TILE_SIZE[0] * scale), ceil(rows * TILE_SIZE[1] * scale))
+
+    def draw(self, surface: pygame.Surface, camera: Camera) -> None:
+        screen_coord = camera.world_to_screen(self.coordinate)
+        bounds_rect = pygame.Rect(screen_coord, self.screen_size(camera.scale))
+        if not bounds_rect.colliderect(pygame.Rect((0, 0), SCREEN_SIZE)):
+            return
+
+        if self.surface is None:
+            self.render()
+        if camera.scale != self._last_scale or self.scaled_surface is None:
+            self.scaled_surface = pygame.transform.scale(self.surface, bounds_rect.size)
+            self._last_scale = camera.scale
+
+        surface.blit(self.scaled_surface, screen_coord)
+        profiler.count("super_chunks_drawn")
+
+    def chunk_blit_source(self, camera: Camera, chunk_pos: tuple[int, int]) -> tuple[pygame.Surface, tuple[int, int]]:
+        """The (surface, position) pair that draws just the part covering the
+        chunk at `chunk_pos`, as a stand in until the chunk itself is ready.
+        """
+        if self.surface is None:
+            self.render()
+
+        area = pygame.Rect(chunk_pos[0] - self.key[0], chunk_pos[1] - self.key[1], CHUNK_SIZE[0], CHUNK_SIZE[1])
+        size = (ceil(CHUNK_SIZE[0] * TILE_SIZE[0] * camera.scale), ceil(CHUNK_SIZE[1] * TILE_SIZE[1] * camera.scale))
+        screen_coord = camera.world_to_screen(pygame.Vector2(chunk_pos))
+        return (pygame.transform.scale(self.surface.subsurface(area), size), (int(screen_coord.x), int(screen_coord.y)))
+
+class LodTerrain:
+    """Level of detail terrain for when the camera is zoomed far out.
+
+    Below LOD_SCALE the world stops generating chunks and draws super chunks
+    instead: one pixel per tile, covering LOD_CHUNKS x LOD_CHUNKS chunks
+    each. They are generated the same way chunks are, in the background when
+    the world has worker processes. Once zoomed back in, super chunks fill
+    in for chunks that haven't been generated yet.
+
+    Like chunks, super chunks whose rivers aren't worked out yet are
+    sketched without them first and made again once they are in, see
+    World.request_chunk.
+    """
+
+    def __init__(self, world, generate_func, generate_args: tuple = (), async_generation: bool = True,
+                 chunks_per_side: int = LOD_CHUNKS, max_super_chunks: int = LOD_MAX_SUPER_CHUNKS,
+                 pool: WorkerPool | None = None):
+        self.world = world
+        self.size = (chunks_per_side * CHUNK_SIZE[0], chunks_per_side * CHUNK_SIZE[1]) # In tiles
+        self.max_super_chunks = max_super_chunks
+        self.super_chunks = {}
+
+        # Called as generate_func(key, *generate_args, size, rivers=..., skip_rivers=...), returns
+        # (heights, tile_ids). rivers holds the river regions of the super chunk, see RiverRegions
+        self.generate_func = generate_func
+        self.generate_args = generate_args + (self.size,)
+        self.generator = None
+        self.sketch_generator = None
+        if async_generation:
+            self.generator = ChunkGenerator(generate_func, self.generate_args, pool=pool)
+            self.sketch_generator = ChunkGenerator(generate_func, self.generate_args, pool=pool)
+        self.sketches = set() # Keys of the super chunks made without rivers
+
+    def is_active(self) -> bool:
+        return self.world.camera.scale < LOD_SCALE
+
+    def get_super_chunk_key(self, coord) -> tuple[int, int]:
+        return (int(coord[0] // self.size[0] * self.size[0]), int(coord[1] // self.size[1] * self.size[1]))
+
+    def visible_range(self) -> tuple[int, int, int, int]:
+        """Like World.visible_chunk_range, for super chunks"""
+        camera = self.world.camera
+        left, top = self.get_super_chunk_key(camera.screen_to_world(pygame.Vector2(0, 0)))
+        right, bottom = self.get_super_chunk_key(camera.screen_to_world(pygame.Vector2(SCREEN_SIZE)))
+        return (left, top, right, bottom)
+
+    def visible_keys(self, visible: tuple[int, int, int, int] | None = None):
+        left, top, right, bottom = visible or self.visible_range()
+        for key_y in range(top, bottom + 1, self.size[1]):
+            for key_x in range(left, right + 1, self.size[0]):
+                yield (key_x, key_y)
+
+    def distance_to_camera(self, key: tuple[int, int]) -> float:
+        center = pygame.Vector2(key[0] + self.size[0] / 2, key[1] + self.size[1] / 2)
+        return center.distance_squared_to(self.world.camera.position)
+
+    def gather_rivers(self, key: tuple[int, int]) -> dict | None:
+        """The river regions of a super chunk, or None while they are still being worked out"""
+        rivers = self.world.rivers
+        return rivers.gather(rivers.region_keys(key, self.size), (0, self.distance_to_camera(key)))
+
+    def update(self) -> None:
+        visible = self.visible_range()
+        # Missing ones first, then the sketches, closest first
+        todo = sorted((key for key in self.visible_keys(visible) if key not in self.super_chunks or key in self.sketches),
+                      key=lambda key: (key in self.super_chunks, self.distance_to_camera(key)))
+
+        if self.generator is None:
+            # A super chunk is a lot of work, only make one each frame
+            for key in todo:
+                river_regions = self.gather_rivers(key)
+                if river_regions is not None:
+                    self.add(key, *self.generate_func(key, *self.generate_args, rivers=river_regions))
+                    break
+                if key not in self.super_chunks:
+                    self.add(key, *self.generate_func(key, *self.generate_args, skip_rivers=True), sketch=True)
+                    break
+        else:
+            for key in todo:
+                if self.generator.is_pending(key):
+                    continue
+                river_regions = self.gather_rivers(key)
+                if river_regions is not None:
+                    self.generator.request(key, (key in self.super_chunks, self.distance_to_camera(key)), {"rivers": river_regions})
+                elif key not in self.super_chunks:
+                    self.sketch_generator.request(key, (False, self.distance_to_camera(key)), {"skip_rivers": True})
+            for generator in (self.generator, self.sketch_generator):
+                for key in generator.pending_keys():
+                    if not self.world.chunk_in_range(key, visible):
+                        generator.cancel(key)
+            finished = self.generator.poll(CHUNK_INTEGRATION_BUDGET)
+            for key, (heights, tile_ids) in finished:
+                self.sketch_generator.cancel(key)
+                self.add(key, heights, tile_ids)
+            for key, (heights, tile_ids) in self.sketch_generator.poll(CHUNK_INTEGRATION_BUDGET - len(finished)):
+                if key not in self.super_chunks:
+                    self.add(key, heights, tile_ids, sketch=True)
+
+        self.evict(visible)
+
+    def add(self, key: tuple[int, int], heights, tile_ids, sketch: bool = False) -> SuperChunk:
+        super_chunk = SuperChunk(pygame.Vector2(key), tile_ids, self.world.calculate_shade(heights))
+        self.super_chunks[key] = super_chunk
+        if sketch:
+            self.sketches.add(key)
+            profiler.count("super_chunk_sketches_generated")
+        else:
+            self.sketches.discard(key)
+            profiler.count("super_chunks_generated")
+        return super_chunk
+
+    def evict(self, visible: tuple[int, int, int, int]) -> None:
+        """Drop the furthest super chunks that are off screen once there are
+        more than max_super_chunks
+        """
+        extra = len(self.super_chunks) - self.max_super_chunks
+        if extra <= 0:
+            return
+
+        hidden = [key for key in self.super_chunks if not self.world.chunk_in_range(key, visible)]
+        for key in sorted(hidden, key=self.distance_to_camera, reverse=True)[:extra]:
+            del self.super_chunks[key]
+            self.sketches.discard(key)
+
+    def set_tile(self, coord, tile_id: int) -> None:
+        """Keep a super chunk in line with a tile changed with World.set_tile"""
+        key = self.get_super_chunk_key(coord)
+        super_chunk = self.super_chunks.get(key)
+        if super_chunk is not None:
+            super_chunk.tile_ids[int(coord[1]) - key[1]][int(coord[0]) - key[0]] = tile_id
+            super_chunk.surface = None
+
+    def memory_usage(self) -> int:
+        return sum(super_chunk.memory_usage() for super_chunk in self.super_chunks.values())
+
+    def draw(self, surface: pygame.Surface) -> None:
+        for key in self.visible_keys():
+            super_chunk = self.super_chunks.get(key)
+            if super_chunk is not None:
+                super_chunk.draw(surface, self.world.camera)
+
+    def placeholder(self, chunk_pos: tuple[int, int]) -> tuple[pygame.Surface, tuple[int, int]] | None:
+        """The low detail (surface, position) pair to draw for a chunk that
+        isn't loaded, if there is one
+        """
+        super_chunk = self.super_chunks.get(self.get_super_chunk_key(chunk_pos))
+        if super_chunk is None:
+            return None
+        return super_chunk.chunk_blit_source(self.world.camera, chunk_pos)
+
+    def close(self) -> None:
+        for generator in (self.generator, self.sketch_generator):
+            if generator is not None:
+                generator.shutdown()
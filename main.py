@@ -1,7 +1,9 @@
+import time
 import pygame
 
-from globals import SCREEN_SIZE
+from globals import SCREEN_SIZE, SHOW_PROFILER, PROFILER_DUMP_INTERVAL
 from world import World
+from profiler import profiler, ProfilerOverlay
 
 def run():
     screen = pygame.display.set_mode(SCREEN_SIZE)
@@ -11,10 +13,16 @@ def run():
     
     clock = pygame.time.Clock()
 
+    pygame.font.init()
+    overlay = ProfilerOverlay(profiler)
+    overlay.visible = SHOW_PROFILER
+    last_dump = time.perf_counter()
+
     done = False
     while not done:
         # Limit to 60 fps to avoid doing unnecessary work on the CPU
         delta = clock.tick(60) / 1000.0 # time passed in seconds since last call
+        frame_start = time.perf_counter()
         pos = pygame.Vector2(*pygame.mouse.get_pos())
         
         for event in pygame.event.get():
@@ -28,6 +36,9 @@ def run():
                 if event.key == pygame.K_F2:
                     pygame.image.save(screen, "SCREENSHOT.png")
 
+                if event.key == pygame.K_F3:
+                    overlay.visible = not overlay.visible
+
                 if event.key == pygame.K_SPACE:
                     world.generate()
                     world.render_chunks()
@@ -78,9 +89,20 @@ def run():
         
         # Draw the screen
         world.draw(screen)
+        overlay.draw(screen)
         
         pygame.display.update()
-        pygame.display.set_caption(f"FPS: {round(clock.get_fps(), 2)}. Mouse POS: {world.get_corresponding_chunk(world.camera.screen_to_world(pos))}")
+        profiler.add_time("frame", time.perf_counter() - frame_start)
+        profiler.end_frame()
+
+        if PROFILER_DUMP_INTERVAL > 0 and time.perf_counter() - last_dump > PROFILER_DUMP_INTERVAL:
+            profiler.dump()
+            last_dump = time.perf_counter()
+
+        pygame.display.set_caption(f"FPS: {round(clock.get_fps(), 2)}. Mouse POS: {world.get_corresponding_chunk(world.camera.screen_to_world(pos))}. "
+                                   f"Chunk memory: {world.chunk_residency.resident_bytes / 1024 / 1024:.1f} MB")
+
+    world.close()
 
 if __name__ == "__main__":
     run() 
\ No newline at end of file
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from math import ceil
+import pygame
+
+class MipmapCache:
+    """Pre-scaled copies of chunk surfaces at fixed zoom steps, shared by
+    every chunk in the world.
+
+    When zoomed out, a chunk is scaled from the smallest level that is still
+    larger than the zoom instead of from its full size surface. Levels are
+    filtered with smoothscale, and are built from the level above them, so
+    each one is cheap to make. The least recently used levels are dropped
+    when the cache goes over `budget_bytes`.
+    """
+
+    LEVELS = (0.5, 0.25, 0.125)
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.resident_bytes = 0
+        self._levels = OrderedDict() # (chunk key, level) -> pygame.Surface
+
+    @staticmethod
+    def source_level(scale: float) -> float | None:
+        """The smallest level at least as large as `scale`. None means the
+        full size surface should be used.
+        """
+        best = None
+        for level in MipmapCache.LEVELS:
+            if level >= scale:
+                best = level
+        return best
+
+    @staticmethod
+    def level_size(surface: pygame.Surface, level: float) -> tuple[int, int]:
+        return (max(1, ceil(surface.get_width() * level)), max(1, ceil(surface.get_height() * level)))
+
+    def get(self, key, surface: pygame.Surface, level: float) -> pygame.Surface:
+        """Return `surface` (the full size surface of the chunk at `key`) at
+        one of the LEVELS, building it if needed.
+        """
+        cached = self._levels.get((key, level))
+        if cached is not None:
+            self._levels.move_to_end((key, level))
+            return cached
+
+        if level * 2 < 1:
+            parent = self.get(key, surface, level * 2)
+        else:
+            parent = surface
+
+        scaled = pygame.transform.smoothscale(parent, MipmapCache.level_size(surface, level))
+        self._levels[(key, level)] = scaled
+        self.resident_bytes += scaled.get_pitch() * scaled.get_height()
+
+        while self.resident_bytes > self.budget_bytes and len(self._levels) > 1:
+            _, oldest = self._levels.popitem(last=False)
+            self.resident_bytes -= oldest.get_pitch() * oldest.get_height()
+
+        return scaled
+
+    def invalidate(self, key, below: float = 1.0) -> None:
+        """Forget the levels of a chunk smaller than `below`, all of them by
+        default, for when its surface changes
+        """
+        for level in MipmapCache.LEVELS:
+            if level >= below:
+                continue
+            old = self._levels.pop((key, level), None)
+            if old is not None:
+                self.resident_bytes -= old.get_pitch() * old.get_height()
+
+    def update_region(self, key, surface: pygame.Surface, rect: pygame.Rect) -> None:
+        """Bring the cached levels of a chunk up to date after `rect` (in
+        pixels of the full size `surface`) was redrawn, by scaling just that
+        part again. `rect` has to line up with the tiles so it stays whole
+        pixels at every level.
+        """
+        parent = surface
+        parent_level = 1.0
+        for level in MipmapCache.LEVELS:
+            cached = self._levels.get((key, level))
+            if cached is None:
+                # The smaller levels are built from this one, they get rebuilt when needed
+                self.invalidate(key, below=level)
+                return
+
+            source = pygame.Rect(rect.x * parent_level, rect.y * parent_level, rect.w * parent_level, rect.h * parent_level)
+            target = pygame.Rect(rect.x * level, rect.y * level, rect.w * level, rect.h * level)
+            cached.blit(pygame.transform.smoothscale(parent.subsurface(source), target.size), target)
+            parent = cached
+            parent_level = level
@@ -0,0 +1,120 @@
+import math
+import pygame
+
+from camera import Camera
+from profiler import profiler
+
+from globals import CHUNK_SIZE, LOD_SCALE, PREFETCH_FRAMES, PREFETCH_MAX_CHUNKS, PREFETCH_SMOOTHING
+
+class ChunkPrefetcher:
+    """Guesses which chunks are about to scroll or zoom into view, so they
+    can be generated before they are needed.
+
+    The camera's velocity and zoom rate are tracked every frame. The view is
+    then played forward for up to `frames` frames, and every chunk it covers
+    that isn't in view yet is predicted, at most `max_chunks` of them. The
+    prediction is made again every frame, so chunks the camera turned away
+    from drop out of it and their requests can be cancelled.
+    """
+
+    def __init__(self, world, frames: int = PREFETCH_FRAMES, max_chunks: int = PREFETCH_MAX_CHUNKS,
+                 smoothing: float = PREFETCH_SMOOTHING):
+        self.world = world
+        self.frames = frames
+        self.max_chunks = max_chunks
+        # How much of the last frame's movement goes into the velocity, 1 uses only the last frame
+        self.smoothing = smoothing
+
+        self.velocity = pygame.Vector2(0, 0) # Tiles per second
+        self.zoom_rate = 0.0 # Change in log(scale) per second
+        self.frame_time = 0.0
+        self._last_position = None
+        self._last_scale = None
+
+    def track(self, camera: Camera, delta: float) -> None:
+        """Update the velocity and zoom rate from where the camera is now"""
+        position = pygame.Vector2(camera.position)
+        if self._last_position is not None and delta > 0:
+            velocity = (position - self._last_position) / delta
+            zoom_rate = math.log(camera.scale / self._last_scale) / delta
+            self.velocity += (velocity - self.velocity) * self.smoothing
+            self.zoom_rate += (zoom_rate - self.zoom_rate) * self.smoothing
+            self.frame_time = delta
+
+        self._last_position = position
+        self._last_scale = camera.scale
+
+    def is_moving(self) -> bool:
+        return self.velocity.length_squared() > 1e-6 or abs(self.zoom_rate) > 1e-6
+
+    def predicted_chunks(self, visible: tuple[int, int, int, int]) -> dict:
+        """The chunks outside of `visible` that should come into view within
+        `frames` frames, keyed by chunk with the frame they show up on. Earlier
+        frames come first.
+        """
+        predicted = {}
+        if self.frames <= 0 or self.max_chunks <= 0 or not self.is_moving():
+            return predicted
+
+        camera = self.world.camera
+        future = Camera(pygame.Vector2(camera.position))
+        last_range = visible
+        for frame in range(1, self.frames + 1):
+            seconds = frame * self.frame_time
+            future.position = camera.position + self.velocity * seconds
+            future.scale = camera.scale * math.exp(self.zoom_rate * seconds)
+            if future.scale < LOD_SCALE:
+                # From here on the low detail terrain is drawn instead of chunks
+                break
+
+            view_range = self.world.visible_chunk_range(future)
+            if view_range == last_range:
+                # Still the same chunks, nothing new to add
+                continue
+            last_range = view_range
+
+            for chunk_pos in self.world.visible_chunk_keys(view_range):
+                if chunk_pos in predicted or self.world.chunk_in_range(chunk_pos, visible):
+                    continue
+                predicted[chunk_pos] = frame
+                if len(predicted) >= self.max_chunks:
+                    return predicted
+
+        return predicted
+
+    def prefetch(self, visible: tuple[int, int, int, int]) -> dict:
+        """Request every predicted chunk that isn't loaded yet. Returns the
+        predictions, to keep their requests from being cancelled.
+        """
+        predicted = self.predicted_chunks(visible)
+        requested = 0
+        for chunk_pos, frame in predicted.items():
+            if chunk_pos in self.world.chunks:
+                continue
+            if not self.world.is_chunk_pending(chunk_pos):
+                requested += 1
+            # Pending requests are moved up the queue as their frame gets closer
+            self.world.request_chunk(chunk_pos, frame)
+        profiler.count("chunks_prefetched", requested)
+        return predicted
+
+    def prefetch_rivers(self, visible: tuple[int, int, int, int]) -> None:
+        """Queue the river regions next to `visible` on the sides the camera
+        is heading towards. Rivers take a while, so they are started before
+        any chunk in them is predicted, behind everything chunks wait for.
+        """
+        if self.frames <= 0 or self.velocity.length_squared() <= 1e-6:
+            return
+
+        rivers = self.world.rivers
+        region_w, region_h = rivers.network.region_size
+        left = visible[0] - (region_w if self.velocity.x < 0 else 0)
+        top = visible[1] - (region_h if self.velocity.y < 0 else 0)
+        right = visible[2] + CHUNK_SIZE[0] + (region_w if self.velocity.x > 0 else 0)
+        bottom = visible[3] + CHUNK_SIZE[1] + (region_h if self.velocity.y > 0 else 0)
+
+        camera_pos = self.world.camera.position
+        def priority(key):
+            center = (key[0] + region_w / 2, key[1] + region_h / 2)
+            return (self.frames + 1, camera_pos.distance_squared_to(center))
+        rivers.prefetch((left, top), (right - left, bottom - top), priority)
@@ -0,0 +1,135 @@
+"""Generate a rectangle of chunks ahead of time and save them to a chunk store.
+
+Runs without a window, on as many worker processes as there are cores. The
+game then loads the chunks from the store instead of generating them:
+
+    python pregenerate.py --seed 1 --store chunks -64 -64 63 63
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from globals import CHUNK_SIZE, WORLD_SEED, CHUNK_STORE_PATH
+
+def blocks(left: int, top: int, right: int, bottom: int, block_size: int):
+    """Split the chunk rectangle into blocks of at most block_size x
+    block_size chunks. Yields (origin, (columns, rows)), origin in tiles.
+    """
+    for block_y in range(top, bottom + 1, block_size):
+        for block_x in range(left, right + 1, block_size):
+            columns = min(block_size, right + 1 - block_x)
+            rows = min(block_size, bottom + 1 - block_y)
+            yield (block_x * CHUNK_SIZE[0], block_y * CHUNK_SIZE[1]), (columns, rows)
+
+def block_positions(origin, chunks):
+    return [(origin[0] + col * CHUNK_SIZE[0], origin[1] + row * CHUNK_SIZE[1])
+            for row in range(chunks[1]) for col in range(chunks[0])]
+
+def pregenerate(world, rect: tuple[int, int, int, int], workers: int | None = None, block_size: int = 8,
+                overwrite: bool = False, report_interval: float = 1.0) -> dict:
+    """Generate every chunk in `rect` (left, top, right, bottom, in chunks,
+    both ends inclusive) and save it to world.chunk_store. Chunks that are
+    already in the store are skipped unless `overwrite` is set.
+
+    The river regions the blocks need are worked out first, once each, and
+    handed to every block that needs them.
+    """
+    from world import generate_block_data, generate_river_region, chunk_river_rect
+
+    store = world.chunk_store
+    todo = []
+    skipped = 0
+    for origin, chunks in blocks(*rect, block_size):
+        if not overwrite and all(store.contains(pos) for pos in block_positions(origin, chunks)):
+            skipped += chunks[0] * chunks[1]
+        else:
+            todo.append((origin, chunks))
+
+    total = sum(columns * rows for _, (columns, rows) in todo)
+    args = (world.rand_seed_x, world.rand_seed_y, world.thermal_erosion_iterations, world.hydraulic_erosion_iterations)
+    workers = workers or os.cpu_count() or 1
+
+    def block_river_keys(origin, chunks):
+        position, size = chunk_river_rect(origin)
+        return world.rivers.region_keys(position, (size[0] + (chunks[0] - 1) * CHUNK_SIZE[0],
+                                                   size[1] + (chunks[1] - 1) * CHUNK_SIZE[1]))
+
+    done = 0
+    start = last_report = time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        river_regions = None
+        if world.rivers.generator is not None:
+            keys = sorted({key for origin, chunks in todo for key in block_river_keys(origin, chunks)})
+            masks = executor.map(generate_river_region, keys, *([arg] * len(keys) for arg in args))
+            river_regions = dict(zip(keys, masks))
+
+        pending = set()
+        queue = iter(todo)
+        while True:
+            # Only a few blocks ahead of the workers, so the results don't pile up in memory
+            for origin, chunks in queue:
+                rivers = None
+                if river_regions is not None:
+                    rivers = {key: river_regions[key] for key in block_river_keys(origin, chunks)}
+                pending.add(executor.submit(generate_block_data, origin, chunks, *args, rivers=rivers))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for position, heights, tile_ids in future.result():
+                    store.save(position, heights, tile_ids)
+                    done += 1
+
+            now = time.perf_counter()
+            if now - last_report >= report_interval:
+                rate = done / (now - start)
+                eta = (total - done) / rate if rate > 0 else 0
+                print(f"{done}/{total} chunks, {rate:.1f} chunks/s, {eta:.0f}s left", file=sys.stderr, flush=True)
+                last_report = now
+
+    store.flush()
+    seconds = time.perf_counter() - start
+    return {
+        "chunks": done,
+        "skipped": skipped,
+        "seconds": seconds,
+        "chunks_per_sec": done / seconds if seconds > 0 else None,
+        "workers": workers,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rect", type=int, nargs=4, metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                        help="chunks to generate, in chunks rather than tiles, both ends inclusive")
+    parser.add_argument("--seed", type=int, default=WORLD_SEED, required=WORLD_SEED is None)
+    parser.add_argument("--store", default=CHUNK_STORE_PATH, required=CHUNK_STORE_PATH is None,
+                        help="chunk store directory, the game reads it through CHUNK_STORE_PATH")
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to one per core")
+    parser.add_argument("--block-size", type=int, default=8, help="side of the block of chunks each task generates")
+    parser.add_argument("--overwrite", action="store_true", help="generate chunks that are already in the store again")
+    args = parser.parse_args(argv)
+
+    left, top, right, bottom = args.rect
+    if right < left or bottom < top:
+        parser.error("RIGHT and BOTTOM can't be less than LEFT and TOP")
+
+    from world import World
+
+    world = World(seed=args.seed, async_generation=False, store_path=args.store)
+    result = pregenerate(world, (left, top, right, bottom), args.workers, args.block_size, args.overwrite)
+    world.close()
+
+    print(f"Generated {result['chunks']} chunks ({result['skipped']} already saved) in {result['seconds']:.1f}s, "
+          f"{result['chunks_per_sec'] or 0:.1f} chunks/s on {result['workers']} workers")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+from collections import deque
+from contextlib import contextmanager
+import functools
+import json
+import time
+import pygame
+
+class Profiler:
+    """Registry of named timers and counters for the hot paths.
+
+    Times and counts are added up over a frame. end_frame pushes the totals
+    into a rolling window of the last `window` frames, which the stats are
+    calculated from.
+    """
+
+    def __init__(self, window: int = 120):
+        self.window = window
+        self._frame = {} # name -> total for the current frame
+        self.history = {} # name -> deque of per frame totals
+        self.kinds = {} # name -> "time" or "count"
+
+    def _register(self, name: str, kind: str) -> None:
+        if name not in self.history:
+            self.history[name] = deque(maxlen=self.window)
+            self.kinds[name] = kind
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self._register(name, "time")
+        self._frame[name] = self._frame.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self._register(name, "count")
+        self._frame[name] = self._frame.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def end_frame(self) -> None:
+        for name, values in self.history.items():
+            values.append(self._frame.get(name, 0))
+        self._frame = {}
+
+    def stats(self, name: str) -> dict:
+        """Last, mean and max per frame value of a timer (in ms) or counter"""
+        values = self.history.get(name)
+        if not values:
+            return {"last": 0, "mean": 0, "max": 0}
+
+        scale = 1000 if self.kinds[name] == "time" else 1
+        return {
+            "last": values[-1] * scale,
+            "mean": sum(values) / len(values) * scale,
+            "max": max(values) * scale,
+        }
+
+    def report(self) -> dict:
+        return {name: dict(self.stats(name), kind=self.kinds[name]) for name in sorted(self.history)}
+
+    def dump(self, file=None) -> None:
+        """Write the report as a single line of JSON"""
+        print(json.dumps({"time": time.time(), "stats": self.report()}), file=file, flush=True)
+
+    def reset(self) -> None:
+        self._frame = {}
+        self.history = {}
+        self.kinds = {}
+
+# Shared by the whole game, so any module can add to it
+profiler = Profiler()
+
+def timefunc(func):
+    """Decorator that reports the execution time."""
+    name = getattr(func, "__name__", repr(func))
+
+    @functools.wraps(func)
+    def wrap(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        end = time.perf_counter()
+
+        profiler.add_time(name, end - start)
+        return result
+    return wrap
+
+class ProfilerOverlay:
+    """Draws the profiler's per frame stats in the corner of the screen.
+    Timers that take more than the frame budget on average are drawn red.
+    """
+
+    FRAME_BUDGET_MS = 1000 / 60
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+        self.visible = False
+        self.font = None
+
+    def draw(self, surface: pygame.Surface) -> None:
+        if not self.visible:
+            return
+        if self.font is None:
+            self.font = pygame.font.SysFont("monospace", 14)
+
+        lines = [("per frame        last    mean     max", (255, 255, 255))]
+        for name, stats in self.profiler.report().items():
+            if stats["kind"] == "time":
+                text = f"{name:<14} {stats['last']:6.2f}  {stats['mean']:6.2f}  {stats['max']:6.2f} ms"
+                color = (255, 80, 80) if stats["mean"] > ProfilerOverlay.FRAME_BUDGET_MS else (255, 255, 255)
+            else:
+                text = f"{name:<14} {stats['last']:6.0f}  {stats['mean']:6.1f}  {stats['max']:6.0f}"
+                color = (180, 220, 255)
+            lines.append((text, color))
+
+        rendered = [self.font.render(text, True, color) for text, color in lines]
+        width = max(text.get_width() for text in rendered) + 10
+        height = sum(text.get_height() for text in rendered) + 10
+        background = pygame.Surface((width, height))
+        background.set_alpha(180)
+        surface.blit(background, (0, 0))
+
+        y = 5
+        for text in rendered:
+            surface.blit(text, (5, y))
+            y += text.get_height()
@@ -0,0 +1,79 @@
+from chunk_generator import ChunkGenerator, WorkerPool
+from profiler import profiler
+
+class RiverRegions:
+    """Works out the river regions chunks and super chunks need in worker
+    processes, once each.
+
+    Chunks ask for the regions they need with `gather` before they are
+    generated. Regions that are missing are queued, and the chunk either
+    waits for a later frame or goes ahead without rivers for now, see
+    World.request_chunk. Finished regions go into the main process's
+    RiverNetwork, and are passed along with the chunk to whichever process
+    generates it, so no process works out a region another one already has.
+    Regions that are still waiting once they are far from the view are
+    cancelled by `update`.
+    """
+
+    def __init__(self, network, generate_func, generate_args: tuple = (), enabled: bool = True,
+                 pool: WorkerPool | None = None):
+        # The RiverNetwork of the main process, it keeps the finished regions
+        self.network = network
+        # Called as generate_func(region key, *generate_args), returns the region's river mask
+        self.generator = None
+        if enabled:
+            # A region takes as long as about a hundred chunks, keep it to half
+            # of the workers so chunks never queue up behind regions. With just
+            # one worker to share, regions get a process of their own instead
+            if pool is not None and pool.max_workers < 2:
+                self.generator = ChunkGenerator(generate_func, generate_args, max_workers=1)
+            else:
+                self.generator = ChunkGenerator(generate_func, generate_args, pool=pool)
+            self.generator.max_in_flight = max(1, self.generator.max_workers // 2)
+
+    def region_keys(self, position, size) -> list[tuple[int, int]]:
+        return self.network.region_keys(position, size)
+
+    def gather(self, keys, priority=0.0) -> dict | None:
+        """{region key: river mask} of all of `keys`, or None while some of
+        them are still being worked out. Missing regions are queued with
+        `priority`, see ChunkGenerator.request.
+        """
+        if self.generator is None:
+            return {}
+
+        missing = [key for key in keys if not self.network.contains(key)]
+        if missing:
+            for key in missing:
+                self.generator.request(key, priority)
+            return None
+        return {key: self.network.region(key) for key in keys}
+
+    def prefetch(self, position, size, priority_func) -> None:
+        """Queue the regions of a rectangle of tiles before any chunk needs
+        them. priority_func(key) gives the priority of each region.
+        """
+        for key in self.region_keys(position, size):
+            self.gather([key], priority_func(key))
+
+    def update(self, position, size) -> None:
+        """Collect finished regions, and cancel the waiting ones that are more
+        than a region away from the rectangle of tiles in view
+        """
+        if self.generator is None:
+            return
+
+        region_w, region_h = self.network.region_size
+        near = set(self.region_keys((position[0] - region_w, position[1] - region_h),
+                                    (size[0] + 2 * region_w, size[1] + 2 * region_h)))
+        for key in self.generator.pending_keys():
+            if key not in near:
+                self.generator.cancel(key)
+
+        for key, rivers in self.generator.poll(len(self.generator.pending_keys())):
+            self.network.put(key, rivers)
+            profiler.count("river_regions_generated")
+
+    def close(self) -> None:
+        if self.generator is not None:
+            self.generator.shutdown()
@@ -1,6 +1,12 @@
 from math import ceil
 import pygame
+import numpy as np
 from camera import Camera
+from tiles import TILE_TYPES, TILE_IDS
+from tiles.tile import Tile
+from tiles.tile_stamps import TileStamps
+from mipmap_cache import MipmapCache
+from profiler import profiler
 
 from globals import DRAW_CHUNK_OUTLINES, SCREEN_SIZE, TILE_SIZE, CHUNK_SIZE
 
@@ -9,22 +15,38 @@ class TileChunk:
     """Segments tiles into a smaller sub-grid to save on memory and 
     drawing speed.
     
-    Currently only stores the surface the tiles draw onto, but may (and 
-    probably should) be modified to hold the tiles themselves.
+    Tiles are stored as arrays indexed [y][x] rather than as Tile objects:
+    `tile_ids` holds the index of each tile's type in TILE_TYPES and `shade`
+    the alpha of the shadow drawn over it. Tile objects are only created
+    when asked for with get_tile.
+
+    Tiles changed with set_tile are collected in `dirty_rects`, and only
+    those are drawn again, on the surface and its scaled copies.
     """
 
     SCREEN_RECT = pygame.Rect((0, 0, *SCREEN_SIZE))
 
-    def __init__(self, coordinate: pygame.Vector2, tiles, world=None):
+    def __init__(self, coordinate: pygame.Vector2, tile_ids: np.ndarray, shade: np.ndarray, world=None):
         self.coordinate = coordinate # These are in tile coordinates, not pixel coordinates
         self.width_px  = CHUNK_SIZE[0] * TILE_SIZE[0]
         self.height_px = CHUNK_SIZE[1] * TILE_SIZE[1]
         self.surface = pygame.Surface((self.width_px, self.height_px))
         self.scaled_surface = None
+        self._owns_scaled_surface = False
         self._last_scale = None
         self.world = world
-        self.tiles = tiles
+        self.key = (int(coordinate[0]), int(coordinate[1]))
+        self.tile_ids = tile_ids
+        self.shade = shade
+        # Set by the world, see chunk_store.chunk_hash
+        self.content_hash = None
+        self.heights = None
+        # True when the chunk has been changed since it was generated
+        self.modified = False
         self.isdirty = True
+        self.dirty_rects = [] # In tiles, see set_tile
+        # Goes up every time the surface is drawn again
+        self.version = 0
 
     def draw_to_chunk(self, surface, coordinate) -> None:
         self.surface.blit(surface, coordinate)
@@ -32,36 +54,204 @@ class TileChunk:
     def get_chunk_surf(self) -> pygame.Surface:
         return self.surface
 
+    @staticmethod
+    def surface_bytes(surface: pygame.Surface | None) -> int:
+        if surface is None:
+            return 0
+        return surface.get_pitch() * surface.get_height()
+
+    def memory_usage(self) -> int:
+        """Approximate number of bytes held by this chunk"""
+        total = TileChunk.surface_bytes(self.surface)
+        # The scaled surface can be the base surface itself, or a level owned by the MipmapCache
+        if self._owns_scaled_surface:
+            total += TileChunk.surface_bytes(self.scaled_surface)
+        if self.heights is not None:
+            total += self.heights.nbytes
+        return total + self.tile_ids.nbytes + self.shade.nbytes
+
+    def memory_changed(self) -> None:
+        """Let the world's ChunkResidency know memory_usage has changed"""
+        if self.world is not None:
+            self.world.chunk_residency.track(self)
+
+    def get_tile(self, tile_x: int, tile_y: int) -> Tile:
+        """Create a Tile object for the tile at the given chunk-local coordinate"""
+        tile_type = TILE_TYPES[self.tile_ids[tile_y][tile_x]]
+        tile = tile_type(pygame.Vector2((self.coordinate[0] + tile_x) * TILE_SIZE[0],
+                                        (self.coordinate[1] + tile_y) * TILE_SIZE[1]), TILE_SIZE)
+        tile.shadow.set_alpha(int(self.shade[tile_y][tile_x]))
+        return tile
+
+    def set_tile(self, tile_x: int, tile_y: int, tile_type, shade: int | None = None) -> bool:
+        """Change the tile at the given chunk-local coordinate to `tile_type`
+        (a Tile subclass or its id). Returns whether anything changed. Only
+        the changed tile is drawn again the next time the chunk is drawn.
+        """
+        tile_id = tile_type if isinstance(tile_type, (int, np.integer)) else TILE_IDS[tile_type]
+        if shade is None:
+            shade = self.shade[tile_y][tile_x]
+        if self.tile_ids[tile_y][tile_x] == tile_id and self.shade[tile_y][tile_x] == shade:
+            return False
+
+        self.tile_ids[tile_y][tile_x] = tile_id
+        self.shade[tile_y][tile_x] = shade
+        self.dirty_rects.append(pygame.Rect(tile_x, tile_y, 1, 1))
+        self.modified = True
+        return True
+
+    def drop_scaled_surface(self) -> None:
+        self.scaled_surface = None
+        self._owns_scaled_surface = False
+        self._last_scale = None
+        self.memory_changed()
+
+    def drop_surface(self) -> None:
+        """Free the rendered surface. It is rendered again the next time the chunk is drawn"""
+        self.drop_scaled_surface()
+        self.surface = None
+        self.isdirty = True
+        self.memory_changed()
+
     def render(self):
+        if self.surface is None:
+            self.surface = pygame.Surface((self.width_px, self.height_px))
+            self.isdirty = True
+            self.memory_changed()
+
         if self.isdirty:
-            for tile_y, tile_row in enumerate(self.tiles):
-                for tile_x, tile in enumerate(tile_row):
-                    draw_pos = pygame.Vector2(tile_x * TILE_SIZE[0], tile_y * TILE_SIZE[1])
-                    tile.draw(self.surface, draw_pos)
+            # Build the whole surface in one go from pre-drawn tiles
+            with profiler.timer("render"):
+                pygame.surfarray.blit_array(self.surface, TileStamps.rasterize(self.tile_ids, self.shade))
+            profiler.count("chunks_rendered")
 
+            self.version += 1
             self.isdirty = False
+            self.dirty_rects = []
+            # Any scaled copy is out of date now
+            self._last_scale = None
+            if self.world is not None:
+                self.world.mipmaps.invalidate(self.key)
+        elif self.dirty_rects:
+            with profiler.timer("render"):
+                self.render_rects()
+            self.version += 1
 
-    def draw(self, surface, camera: Camera) -> None:
-        screen_coord = camera.world_to_screen(self.coordinate)
+    def render_rects(self) -> None:
+        """Draw just the tiles in dirty_rects again, and patch the same area
+        of the mipmaps and the scaled surface
+        """
+        for rect in self.dirty_rects:
+            rows = slice(rect.top, rect.bottom)
+            cols = slice(rect.left, rect.right)
+            px_rect = pygame.Rect(rect.x * TILE_SIZE[0], rect.y * TILE_SIZE[1], rect.w * TILE_SIZE[0], rect.h * TILE_SIZE[1])
+            pygame.surfarray.blit_array(self.surface.subsurface(px_rect),
+                                        TileStamps.rasterize(self.tile_ids[rows, cols], self.shade[rows, cols]))
+
+            if self.world is not None:
+                self.world.mipmaps.update_region(self.key, self.surface, px_rect)
+            if self._owns_scaled_surface and self.scaled_surface is not None:
+                self.rescale_rect(px_rect)
+            profiler.count("tiles_rendered", rect.w * rect.h)
+        self.dirty_rects = []
 
-        bounds_rect = self.surface.get_rect()
+        if not self._owns_scaled_surface and self.scaled_surface is not None and self.scaled_surface is not self.surface:
+            # scaled_surface is a mipmap level, which update_region only patched if
+            # it was still cached. Look it up again, it gets rebuilt if it wasn't
+            self._last_scale = None
+
+    def rescale_rect(self, px_rect: pygame.Rect) -> None:
+        """Scale the part of the surface in `px_rect` to scaled_surface again.
+        Picks the same pixels pygame.transform.scale does, so the result is
+        the same as scaling the whole surface.
+        """
+        source = self.scale_source(self._last_scale)
+        src_w, src_h = source.get_size()
+        dst_w, dst_h = self.scaled_surface.get_size()
+        # px_rect at the resolution of source
+        ratio_x = src_w / self.width_px
+        ratio_y = src_h / self.height_px
+        src_left, src_right = int(px_rect.left * ratio_x), int(px_rect.right * ratio_x)
+        src_top, src_bottom = int(px_rect.top * ratio_y), int(px_rect.bottom * ratio_y)
+
+        # Every destination pixel x samples source pixel x * src_w // dst_w
+        dst_xs = np.arange(-(-src_left * dst_w // src_w), -(-src_right * dst_w // src_w))
+        dst_ys = np.arange(-(-src_top * dst_h // src_h), -(-src_bottom * dst_h // src_h))
+        if len(dst_xs) == 0 or len(dst_ys) == 0:
+            return
+
+        src_pixels = pygame.surfarray.pixels3d(source)
+        dst_pixels = pygame.surfarray.pixels3d(self.scaled_surface)
+        dst_pixels[dst_xs[0]:dst_xs[-1] + 1, dst_ys[0]:dst_ys[-1] + 1] = \
+            src_pixels[(dst_xs * src_w // dst_w)[:, None], dst_ys * src_h // dst_h]
+        # Unlock the surfaces
+        del src_pixels, dst_pixels
+
+    def scale_source(self, scale: float) -> pygame.Surface:
+        """The surface scaled_surface is made from at the given zoom level"""
+        level = MipmapCache.source_level(scale)
+        if level is not None and self.world is not None:
+            return self.world.mipmaps.get(self.key, self.surface, level)
+        return self.surface
+
+    def rescale(self, scale: float) -> None:
+        """Update scaled_surface to the given zoom level. When zoomed out it
+        is scaled from the closest level in the world's MipmapCache.
+        """
+        # TODO: Using ceil here to avoid annoying lines, but is causing some warping
+        # Note: It does not seem to always remove the lines. Will need to revisit
+        size = (ceil(self.width_px * scale), ceil(self.height_px * scale))
+
+        source = self.scale_source(scale)
+        if source.get_size() == size:
+            self.scaled_surface = source
+            self._owns_scaled_surface = False
+        else:
+            self.scaled_surface = pygame.transform.scale(source, size)
+            self._owns_scaled_surface = True
+        self._last_scale = scale
+        self.memory_changed()
+
+    def get_bounds(self, camera: Camera) -> pygame.Rect:
+        """Where the chunk ends up on the screen"""
+        bounds_rect = pygame.Rect(0, 0, self.width_px, self.height_px)
         bounds_rect.w *= camera.scale
         bounds_rect.h *= camera.scale
-        bounds_rect.topleft = screen_coord
+        screen_coord = camera.world_to_screen(self.coordinate)
+        # Truncated like blit does with a float position. Assigning the float to the rect would round it
+        bounds_rect.topleft = (int(screen_coord.x), int(screen_coord.y))
+        return bounds_rect
+
+    def blit_source(self, camera: Camera) -> tuple[pygame.Surface, tuple[int, int]] | None:
+        """Get the chunk ready to be drawn and return the (surface, position)
+        pair to blit, or None if it is off screen. World.draw hands the pairs
+        of all chunks to Surface.blits at once.
+        """
+        bounds_rect = self.get_bounds(camera)
         # Don't do the work of scaling an image if it won't be on the screen
         if not bounds_rect.colliderect(TileChunk.SCREEN_RECT):
-            return
+            return None
+
+        # The surface may have been freed to save memory, or tiles changed
+        if self.isdirty or self.dirty_rects:
+            self.render()
 
         # Don't scale an image if the camera hasn't changed scales
-        if camera.scale != self._last_scale:
-            # TODO: Using ceil here to avoid annoying lines, but is causing some warping
-            # Note: It does not seem to always remove the lines. Will need to revisit
-            self.scaled_surface = pygame.transform.scale(self.surface, (ceil(self.width_px  * camera.scale),
-                                                                        ceil(self.height_px * camera.scale)))
-            self._last_scale = camera.scale
+        if camera.scale != self._last_scale or self.scaled_surface is None:
+            with profiler.timer("scale"):
+                self.rescale(camera.scale)
+            profiler.count("chunks_rescaled")
+
+        return (self.scaled_surface, bounds_rect.topleft)
 
+    def draw(self, surface, camera: Camera) -> None:
+        blit = self.blit_source(camera)
+        if blit is None:
+            return
 
-        surface.blit(self.scaled_surface, screen_coord)
+        with profiler.timer("blit"):
+            surface.blit(*blit)
+        profiler.count("chunks_drawn")
 
         if DRAW_CHUNK_OUTLINES:
-            pygame.draw.rect(surface, (255, 0, 0), bounds_rect, 1)
\ No newline at end of file
+            pygame.draw.rect(surface, (255, 0, 0), self.get_bounds(camera), 1)
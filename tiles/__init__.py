@@ -0,0 +1,20 @@
+import random
+
+from .tile import Tile, make_noise_texture
+from .tile_water import Water
+from .tile_sand import Sand
+from .tile_dirt import Dirt
+from .tile_grass import Grass
+from .tile_stone import Stone
+from .tile_snow import Snow
+
+# Tile types are passed between processes and stored as small integer ids.
+# Only ever append to this tuple, the position of a type is its id.
+TILE_TYPES = (Water, Sand, Dirt, Grass, Stone, Snow)
+TILE_IDS = {tile_type: tile_id for tile_id, tile_type in enumerate(TILE_TYPES)}
+
+def seed_textures(seed: int) -> None:
+    """Regenerate the random tile textures from a seed"""
+    rng = random.Random(seed)
+    Tile.noise_texture = make_noise_texture(rng, 225)
+    Water.noise_texture = make_noise_texture(rng, 200)
@@ -1,17 +1,26 @@
 import random
 import pygame
 
-class Tile:
-
-    noise_texture = pygame.Surface((16, 16))
-    for x in range(16):
-        for y in range(16):
-            c = random.randint(225, 255)
+def make_noise_texture(rng: random.Random, low: int, size=(16, 16)) -> pygame.Surface:
+    """Grayscale texture where each pixel is a random value between low and 255"""
+    noise_texture = pygame.Surface(size)
+    for x in range(size[0]):
+        for y in range(size[1]):
+            c = rng.randint(low, 255)
             col = (c, c, c)
             noise_texture.set_at((x, y), col)
+    return noise_texture
+
+class Tile:
+
+    # Replaced by tiles.seed_textures when a world is created
+    noise_texture = make_noise_texture(random.Random(0), 225)
 
     light_tex = pygame.Surface((16, 16))
     light_tex.fill((30, 30, 30))
+
+    color = (255, 0, 0) # Red for debug purposes
+    use_noise = True
     
     def __init__(self, coord: pygame.Vector2, size: int | tuple[int, int], height: float=1.0):
         self.position = coord
@@ -20,11 +29,14 @@ class Tile:
             self.size = self.width, self.height = (size, size)
         else:
             self.size = self.width, self.height = size
-            
-        self.color = (255, 0, 0) # Red for debug purposes
+
         self.shadow = pygame.Surface(self.size)
-        self.shadow.set_alpha(min(255, (1.0 - height) * 127))
-        self.use_noise = True
+        self.shadow.set_alpha(Tile.shadow_alpha(height))
+
+    @staticmethod
+    def shadow_alpha(height: float) -> int:
+        """Alpha of the shadow drawn over a tile with the given relative height"""
+        return max(0, min(255, int((1.0 - height) * 127)))
 
     def draw(self, surface, position_override: pygame.Vector2 | None = None) -> None:
         draw_pos = self.position
@@ -35,4 +47,16 @@ class Tile:
         if self.use_noise:
             surface.blit(Tile.noise_texture, draw_pos, special_flags=pygame.BLEND_MULT)
             surface.blit(Tile.light_tex, draw_pos, special_flags=pygame.BLEND_ADD)
-        surface.blit(self.shadow, draw_pos)
\ No newline at end of file
+        surface.blit(self.shadow, draw_pos)
+
+    @staticmethod
+    def draw_tile(surface, tile_type, shade: int, draw_pos: pygame.Vector2, shadow: pygame.Surface) -> None:
+        """Draw a tile of `tile_type` without creating a Tile object. `shadow`
+        is a black surface the size of a tile that gets reused between calls.
+        """
+        pygame.draw.rect(surface, tile_type.color, (draw_pos.x, draw_pos.y, *shadow.get_size()))
+        if tile_type.use_noise:
+            surface.blit(Tile.noise_texture, draw_pos, special_flags=pygame.BLEND_MULT)
+            surface.blit(Tile.light_tex, draw_pos, special_flags=pygame.BLEND_ADD)
+        shadow.set_alpha(shade)
+        surface.blit(shadow, draw_pos)
\ No newline at end of file
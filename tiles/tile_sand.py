@@ -3,6 +3,4 @@ from .tile import Tile
 
 class Sand(Tile):
 
-    def __init__(self, *tile_args) -> None:
-        super().__init__(*tile_args)
-        self.color = (194, 178, 128)
\ No newline at end of file
+    color = (194, 178, 128)
@@ -0,0 +1,68 @@
+import pygame
+import numpy as np
+
+from globals import TILE_SIZE
+from . import TILE_TYPES
+from .tile import Tile
+
+class TileStamps:
+    """Cache of the pixels of a fully drawn tile for every tile type and
+    shade, so a whole chunk can be put together with array indexing instead
+    of drawing every tile. Stamps are drawn with Tile.draw_tile the first
+    time they are needed, so they match it pixel for pixel.
+    """
+
+    # [tile id][shade][x][y][rgb], same layout as pygame.surfarray
+    stamps = np.zeros((len(TILE_TYPES), 256, TILE_SIZE[0], TILE_SIZE[1], 3), dtype=np.uint8)
+    ready = np.zeros((len(TILE_TYPES), 256), dtype=bool)
+    # The noise texture the stamps were drawn with
+    texture = None
+
+    @staticmethod
+    def clear() -> None:
+        """Forget every stamp. Happens automatically when the tile textures change"""
+        TileStamps.ready[:] = False
+
+    @staticmethod
+    def prepare(tile_ids: np.ndarray, shade: np.ndarray) -> None:
+        """Make sure the stamps for every (tile id, shade) pair used are drawn"""
+        if TileStamps.texture is not Tile.noise_texture:
+            TileStamps.clear()
+            TileStamps.texture = Tile.noise_texture
+
+        missing = ~TileStamps.ready[tile_ids, shade]
+        if not missing.any():
+            return
+
+        surf = pygame.Surface(TILE_SIZE)
+        shadow = pygame.Surface(TILE_SIZE)
+        for tile_id, alpha in set(zip(tile_ids[missing].tolist(), shade[missing].tolist())):
+            Tile.draw_tile(surf, TILE_TYPES[tile_id], alpha, pygame.Vector2(0, 0), shadow)
+            TileStamps.stamps[tile_id, alpha] = pygame.surfarray.pixels3d(surf)
+            TileStamps.ready[tile_id, alpha] = True
+
+    @staticmethod
+    def rasterize(tile_ids: np.ndarray, shade: np.ndarray) -> np.ndarray:
+        """Return the pixels of a grid of tiles as an [x][y][rgb] array that
+        can be copied to a surface with pygame.surfarray.blit_array.
+        `tile_ids` and `shade` are indexed [y][x] like in TileChunk.
+        """
+        TileStamps.prepare(tile_ids, shade)
+
+        rows, cols = tile_ids.shape
+        # [tile y][tile x][px x][px y][rgb] -> [tile x][px x][tile y][px y][rgb]
+        tiles = TileStamps.stamps[tile_ids, shade].transpose(1, 2, 0, 3, 4)
+        return tiles.reshape(cols * TILE_SIZE[0], rows * TILE_SIZE[1], 3)
+
+    @staticmethod
+    def average(tile_ids: np.ndarray, shade: np.ndarray) -> np.ndarray:
+        """Like rasterize, but every tile is a single pixel of the average
+        color of its stamp. Used for the zoomed out LOD terrain.
+        """
+        TileStamps.prepare(tile_ids, shade)
+
+        pairs, inverse = np.unique(tile_ids.astype(np.int32) * 256 + shade, return_inverse=True)
+        colors = TileStamps.stamps[pairs // 256, pairs % 256].mean(axis=(1, 2))
+        pixels = colors[inverse.reshape(tile_ids.shape)].round().astype(np.uint8)
+        # [y][x][rgb] -> [x][y][rgb]
+        return pixels.transpose(1, 0, 2)
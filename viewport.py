@@ -0,0 +1,90 @@
+import pygame
+
+from profiler import profiler
+
+from globals import SCREEN_SIZE
+
+class Viewport:
+    """Screen sized surface the visible chunks are composed into, kept from
+    one frame to the next.
+
+    When the camera only pans, the old picture is scrolled and just the
+    strips that came into view are drawn. Chunks that changed since they
+    were last drawn (new, edited, or rendered again) are drawn over their
+    own area. Anything else, like a change of zoom, draws everything again.
+    """
+
+    BACKGROUND = (0, 0, 0)
+
+    def __init__(self, size=SCREEN_SIZE):
+        self.surface = pygame.Surface(size)
+        self.valid = False
+        self._scale = None
+        self._positions = {} # chunk key -> where it was drawn last frame
+        self._drawn = {} # chunk key -> state it was drawn in, see World.chunk_state
+
+    def invalidate(self) -> None:
+        """Draw everything again next frame"""
+        self.valid = False
+
+    def _redraw(self, area: pygame.Rect, blits: dict) -> None:
+        """Draw every chunk that overlaps `area` again, but only inside `area`"""
+        self.surface.fill(Viewport.BACKGROUND, area)
+        self.surface.set_clip(area)
+        self.surface.blits([blit for blit in blits.values() if area.colliderect(blit[1], blit[0].get_size())], doreturn=False)
+        self.surface.set_clip(None)
+        profiler.count("viewport_redraws")
+
+    def _pan_offset(self, blits: dict) -> tuple[int, int] | None:
+        """How far every chunk moved since last frame, or None if they didn't
+        all move by the same amount
+        """
+        offset = None
+        for key, (_, position) in blits.items():
+            old = self._positions.get(key)
+            if old is None:
+                continue
+            moved = (position[0] - old[0], position[1] - old[1])
+            if offset is None:
+                offset = moved
+            elif moved != offset:
+                return None
+        return offset
+
+    def draw(self, world, target: pygame.Surface) -> None:
+        blits = world.chunk_blits()
+        states = {key: world.chunk_state(key) for key in world.visible_chunk_keys()}
+
+        offset = self._pan_offset(blits) if self.valid and world.camera.scale == self._scale else None
+        if offset is None:
+            self.surface.fill(Viewport.BACKGROUND)
+            self.surface.blits(list(blits.values()), doreturn=False)
+            profiler.count("viewport_full_redraws")
+        else:
+            dx, dy = offset
+            width, height = self.surface.get_size()
+            if dx or dy:
+                self.surface.scroll(dx, dy)
+                # The strips that scrolled into view
+                if dx > 0:
+                    self._redraw(pygame.Rect(0, 0, dx, height), blits)
+                elif dx < 0:
+                    self._redraw(pygame.Rect(width + dx, 0, -dx, height), blits)
+                if dy > 0:
+                    self._redraw(pygame.Rect(0, 0, width, dy), blits)
+                elif dy < 0:
+                    self._redraw(pygame.Rect(0, height + dy, width, -dy), blits)
+
+            for key, state in states.items():
+                # Chunks that weren't on screen last frame were drawn with the strips
+                if key in self._drawn and self._drawn[key] != state:
+                    area = world.chunk_screen_rect(key).clip(self.surface.get_rect())
+                    if area.w > 0 and area.h > 0:
+                        self._redraw(area, blits)
+
+        self.valid = True
+        self._scale = world.camera.scale
+        self._positions = {key: position for key, (_, position) in blits.items()}
+        self._drawn = states
+
+        target.blit(self.surface, (0, 0))
@@ -1,24 +1,38 @@
 import chunk
+import functools
+import hashlib
 import math
 import random
 import pygame
+import numpy as np
 
-import time
 from camera import Camera
 
-from procgen.procgen.noise import perlin2D
-
-from globals import TILE_SIZE, WORLD_SIZE, CHUNK_SIZE
+from globals import SCREEN_SIZE, TILE_SIZE, WORLD_SIZE, CHUNK_SIZE, WORLD_SEED, HEIGHTMAP_BACKEND, ASYNC_CHUNK_GENERATION, CHUNK_INTEGRATION_BUDGET, CHUNK_STORE_PATH, CHUNK_MEMORY_BUDGET, MIPMAP_MEMORY_BUDGET, VIEWPORT_BACKING, DRAW_CHUNK_OUTLINES, THERMAL_EROSION_ITERATIONS, HYDRAULIC_EROSION_ITERATIONS, HUMIDITY_DISTANCE, HUMIDITY_METRIC, RIVER_MIN_FLOW, RIVER_REGION_CHUNKS, RIVER_HALO, RIVER_MAX_REGIONS
 from tiles.tile import Tile
-from tiles.tile_dirt import Dirt
-from tiles.tile_grass import Grass
-from tiles.tile_sand import Sand
 from tiles.tile_water import Water
-from tiles.tile_stone import Stone
-from tiles.tile_snow import Snow
+from tiles import TILE_TYPES, TILE_IDS, seed_textures
 from tile_chunk import TileChunk
-
-from world_generation.noise import worley_noise, worley_noise_val, random1, random2, fBm_noise
+from profiler import profiler, timefunc
+from chunk_generator import ChunkGenerator, WorkerPool
+from chunk_store import ChunkStore, chunk_hash
+from chunk_residency import ChunkResidency
+from mipmap_cache import MipmapCache
+from lod import LodTerrain
+from viewport import Viewport
+from prefetch import ChunkPrefetcher
+from river_regions import RiverRegions
+
+from world_generation.noise import random1, random2, fBm_noise
+from world_generation.heightmap import generate_eroded_heightmap, split_into_chunks, terrain_perlin, terrain_worley, WORLEY_CELLS
+from world_generation.perlin import Perlin
+from world_generation.erosion import thermal_erosion_array, hydraulic_erosion_array, hydraulic_erosion_regions
+from world_generation.distance import distance_transform, distance_transform_l1
+from world_generation.humidity import chunk_water_distance, humidity_field
+from world_generation.temperature import temperature_field
+from world_generation.fields import FieldPipeline
+from world_generation.biomes import BIOMES, BIOME_RULES
+from world_generation.rivers import RiverNetwork
 
 def easeInExpo(x: float) -> float:
     if x == 0:
@@ -26,21 +40,155 @@ def easeInExpo(x: float) -> float:
 
     return pow(2, 10 * min(x, 1) - 10)
 
-def noise2D(x: float, y: float) -> float:
-    """perlin2D noise from 0-1"""
-    return perlin2D(x, y) + 0.5
-
-def timefunc(func):
-    """Decorator that reports the execution time."""
-  
-    def wrap(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs)
-        end = time.time()
-          
-        # print(f"{func.__name__} took {round(end-start, 3)}s")
-        return result
-    return wrap
+def noise2D(x: float, y: float, perlin: Perlin) -> float:
+    """Perlin noise moved up by 0.5, so between -0.5 and 1.5. Most of it is
+    within 0-1, only the steepest spots reach further.
+    """
+    return perlin.noise(x, y) + 0.5
+
+# Goes up whenever a change to the generation code changes the terrain, so
+# chunks saved by older versions end up in a different part of the store
+GENERATOR_VERSION = 2
+
+def generator_fingerprint(erosion_iterations: int = 0, hydraulic_iterations: int = 0) -> str:
+    """Short hex string that changes whenever anything that decides what a
+    chunk looks like changes, apart from the seed. See ChunkStore.
+    """
+    settings = (GENERATOR_VERSION, WORLD_SIZE, CHUNK_SIZE, erosion_iterations, hydraulic_iterations,
+                HUMIDITY_DISTANCE, HUMIDITY_METRIC, RIVER_MIN_FLOW, RIVER_REGION_CHUNKS, RIVER_HALO,
+                [(tile_type.__name__, sorted(bounds.items())) for tile_type, bounds in BIOME_RULES])
+    return hashlib.blake2b(repr(settings).encode(), digest_size=8).hexdigest()
+
+@functools.lru_cache(maxsize=4)
+def world_rivers(rand_x: float, rand_y: float, erosion_iterations: int = 0, hydraulic_iterations: int = 0) -> RiverNetwork:
+    """The rivers of a set of world settings, see RiverNetwork"""
+    heights_func = lambda position, size: generate_eroded_heightmap(position, size, rand_x, rand_y,
+                                                                    erosion_iterations, hydraulic_iterations)
+    return RiverNetwork(heights_func, RIVER_MIN_FLOW, (RIVER_REGION_CHUNKS * CHUNK_SIZE[0], RIVER_REGION_CHUNKS * CHUNK_SIZE[1]),
+                        RIVER_HALO, max_regions=RIVER_MAX_REGIONS)
+
+def generate_river_region(key, rand_x: float, rand_y: float, erosion_iterations: int = 0,
+                          hydraulic_iterations: int = 0) -> np.ndarray:
+    """The river mask of one region, for a worker process, see RiverRegions"""
+    return world_rivers(rand_x, rand_y, erosion_iterations, hydraulic_iterations).compute_region(key)
+
+def use_river_regions(rivers: dict | None, rand_x: float, rand_y: float, erosion_iterations: int = 0,
+                      hydraulic_iterations: int = 0) -> None:
+    """Hand river regions worked out in another process, {region key: mask},
+    to this process's RiverNetwork so they aren't worked out again
+    """
+    if not rivers:
+        return
+    network = world_rivers(rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    for key, mask in rivers.items():
+        network.put(key, mask)
+
+def chunk_river_rect(position, chunk_size=CHUNK_SIZE) -> tuple[tuple[int, int], tuple[int, int]]:
+    """(position, size) of the tiles whose rivers a chunk needs: its own,
+    and those of the chunks its humidity looks at
+    """
+    reach_x = math.ceil(math.ceil(HUMIDITY_DISTANCE) / chunk_size[0])
+    reach_y = math.ceil(math.ceil(HUMIDITY_DISTANCE) / chunk_size[1])
+    return ((int(position[0]) - reach_x * chunk_size[0], int(position[1]) - reach_y * chunk_size[1]),
+            ((1 + 2 * reach_x) * chunk_size[0], (1 + 2 * reach_y) * chunk_size[1]))
+
+def river_mask(position, size, rand_x: float, rand_y: float, erosion_iterations: int = 0,
+               hydraulic_iterations: int = 0) -> np.ndarray:
+    """Which tiles of a rectangle are rivers, indexed [y][x]"""
+    if RIVER_MIN_FLOW <= 0:
+        return np.zeros((size[1], size[0]), dtype=bool)
+    return world_rivers(rand_x, rand_y, erosion_iterations, hydraulic_iterations).mask(position, size)
+
+@functools.lru_cache(maxsize=4)
+def world_fields(rand_x: float, rand_y: float, erosion_iterations: int = 0, hydraulic_iterations: int = 0,
+                 chunk_size=CHUNK_SIZE, with_rivers: bool = True) -> FieldPipeline:
+    """The height, river, water, water_distance, temperature and humidity layers of a set
+    of world settings, see FieldPipeline. Kept at module level so every
+    worker process holds on to its own between chunks. Without rivers the
+    river layer is empty, and the layers are kept apart from the ones with.
+    """
+    fields = FieldPipeline(chunk_size=chunk_size)
+    fields.add("height", lambda fields, pos: generate_eroded_heightmap(pos, chunk_size, rand_x, rand_y,
+                                                                       erosion_iterations, hydraulic_iterations))
+    if with_rivers:
+        # Worked out from whole regions of terrain, not from the height layer
+        fields.add("river", lambda fields, pos: river_mask(pos, chunk_size, rand_x, rand_y,
+                                                           erosion_iterations, hydraulic_iterations))
+    else:
+        fields.add("river", lambda fields, pos: np.zeros((chunk_size[1], chunk_size[0]), dtype=bool))
+    fields.add("water", lambda fields, pos: (fields.get("height", pos) < 0.25) | fields.get("river", pos),
+               ("height", "river"))
+    # Reads the water of the neighboring chunks too
+    fields.add("water_distance", lambda fields, pos: chunk_water_distance(functools.partial(fields.get, "water"), pos,
+                                                                          HUMIDITY_DISTANCE, metric=HUMIDITY_METRIC,
+                                                                          chunk_size=chunk_size), ("water",))
+    fields.add("temperature", lambda fields, pos: temperature_field(pos, chunk_size, fields.get("height", pos),
+                                                                    rand_x, rand_y), ("height",))
+    fields.add("humidity", lambda fields, pos: humidity_field(pos, chunk_size, fields.get("water_distance", pos),
+                                                              HUMIDITY_DISTANCE), ("water_distance",))
+    return fields
+
+def generate_chunk_data(position, rand_x: float, rand_y: float, erosion_iterations: int = 0,
+                        hydraulic_iterations: int = 0, chunk_size=CHUNK_SIZE, rivers: dict | None = None,
+                        skip_rivers: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """Compute the heights and tile ids of the chunk at `position`. This is
+    the part of chunk generation that can run in a worker process, the
+    result is turned into a TileChunk with World.add_chunk. `rivers` are
+    river regions that are already known, see use_river_regions. With
+    `skip_rivers` the chunk is made as if there were no rivers at all.
+    """
+    use_river_regions(rivers, rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    fields = world_fields(rand_x, rand_y, erosion_iterations, hydraulic_iterations, chunk_size, not skip_rivers)
+    heights = fields.get("height", position)
+    tile_ids = World.calculate_tile_types(heights, fields.get("humidity", position), fields.get("temperature", position),
+                                          fields.get("river", position))
+    return heights, tile_ids
+
+def generate_block_data(origin, chunks: tuple[int, int], rand_x: float, rand_y: float, erosion_iterations: int = 0,
+                        hydraulic_iterations: int = 0, chunk_size=CHUNK_SIZE, rivers: dict | None = None) -> list:
+    """generate_chunk_data for a block of chunks (columns, rows) with its top
+    left chunk at `origin`. Returns a list of (position, heights, tile_ids).
+
+    The heights of the whole block, and of the chunks around it that the
+    humidity looks at, are generated as one array first. That is the same
+    terrain as generating them a chunk at a time, only a lot faster.
+    """
+    use_river_regions(rivers, rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    fields = world_fields(rand_x, rand_y, erosion_iterations, hydraulic_iterations, chunk_size)
+    reach_x = math.ceil(math.ceil(HUMIDITY_DISTANCE) / chunk_size[0])
+    reach_y = math.ceil(math.ceil(HUMIDITY_DISTANCE) / chunk_size[1])
+
+    corner = (int(origin[0]) - reach_x * chunk_size[0], int(origin[1]) - reach_y * chunk_size[1])
+    size = ((chunks[0] + 2 * reach_x) * chunk_size[0], (chunks[1] + 2 * reach_y) * chunk_size[1])
+    block = generate_eroded_heightmap(corner, size, rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    for position, heights in split_into_chunks(block, corner, chunk_size).items():
+        fields.put("height", position, heights)
+
+    results = []
+    for row in range(chunks[1]):
+        for col in range(chunks[0]):
+            position = (int(origin[0]) + col * chunk_size[0], int(origin[1]) + row * chunk_size[1])
+            results.append((position, *generate_chunk_data(position, rand_x, rand_y, erosion_iterations,
+                                                           hydraulic_iterations, chunk_size)))
+    return results
+
+def generate_lod_data(position, rand_x: float, rand_y: float, erosion_iterations: int = 0,
+                      hydraulic_iterations: int = 0, size=CHUNK_SIZE, rivers: dict | None = None,
+                      skip_rivers: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """generate_chunk_data for a whole super chunk at once, see LodTerrain.
+    Only water inside the super chunk counts towards the humidity, which is
+    close enough from that far out.
+    """
+    use_river_regions(rivers, rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    heights = generate_eroded_heightmap(position, size, rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    if skip_rivers:
+        rivers = np.zeros((size[1], size[0]), dtype=bool)
+    else:
+        rivers = river_mask(position, size, rand_x, rand_y, erosion_iterations, hydraulic_iterations)
+    humidity = humidity_field(position, size, distance_transform((heights < 0.25) | rivers, HUMIDITY_METRIC), HUMIDITY_DISTANCE)
+    temperature = temperature_field(position, size, heights, rand_x, rand_y)
+    tile_ids = World.calculate_tile_types(heights, humidity, temperature, rivers)
+    return heights, tile_ids
 
 class World():
     """Singleton that holds the state of the game world.
@@ -48,7 +196,8 @@ class World():
     Generates random terrain, stores and renders the tiles and chunks.
     """
 
-    def __init__(self):
+    def __init__(self, seed: int | None = WORLD_SEED, heightmap_backend: str = HEIGHTMAP_BACKEND,
+                 async_generation: bool = ASYNC_CHUNK_GENERATION, store_path: str | None = CHUNK_STORE_PATH):
         self.tile_size = TILE_SIZE[0]
         self.tiles = [[None \
             for _ in range(WORLD_SIZE[0])]
@@ -59,8 +208,64 @@ class World():
         
         self.camera = Camera(pygame.Vector2(WORLD_SIZE[0] / 2, WORLD_SIZE[1] / 2))
 
-        self.rand_seed_x = random.uniform(0, 1000)
-        self.rand_seed_y = random.uniform(0, 1000)
+        # Every random value used to generate the world is derived from the seed,
+        # so the same seed always produces the same chunks
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.seed = seed
+        rng = random.Random(seed)
+        self.rand_seed_x = rng.uniform(0, 1000)
+        self.rand_seed_y = rng.uniform(0, 1000)
+        seed_textures(rng.randrange(2**32))
+
+        # Either "numpy" or "scalar". See generate_heightmap
+        self.heightmap_backend = heightmap_backend
+        # Erosion passes run on every chunk, numpy backend only
+        self.thermal_erosion_iterations = THERMAL_EROSION_ITERATIONS
+        self.hydraulic_erosion_iterations = HYDRAULIC_EROSION_ITERATIONS
+
+        # Worker processes shared by the rivers, chunks and super chunks, started when first needed
+        self.workers = WorkerPool()
+
+        # Works out the rivers in the workers, whether or not chunks are generated on the main thread
+        self.rivers = RiverRegions(world_rivers(self.rand_seed_x, self.rand_seed_y, self.thermal_erosion_iterations,
+                                                self.hydraulic_erosion_iterations),
+                                   generate_river_region, (self.rand_seed_x, self.rand_seed_y, self.thermal_erosion_iterations,
+                                                           self.hydraulic_erosion_iterations), RIVER_MIN_FLOW > 0, self.workers)
+
+        # Generates chunks in worker processes. None to generate them on the main thread.
+        # Chunks on screen whose rivers aren't ready yet come from sketch_generator,
+        # made without rivers, and are made again once their rivers are in
+        self.chunk_generator = None
+        self.sketch_generator = None
+        if async_generation:
+            generate_args = (self.rand_seed_x, self.rand_seed_y, self.thermal_erosion_iterations, self.hydraulic_erosion_iterations)
+            self.chunk_generator = ChunkGenerator(generate_chunk_data, generate_args, pool=self.workers)
+            self.sketch_generator = ChunkGenerator(generate_chunk_data, generate_args, pool=self.workers)
+        # Chunks made without rivers, see request_chunk. They aren't saved to the chunk store
+        self.sketches = set()
+
+        # Saves generated chunks to disk so revisiting an area doesn't generate it again
+        self.chunk_store = None
+        if store_path is not None:
+            self.chunk_store = ChunkStore(store_path, self.seed, generator_fingerprint(self.thermal_erosion_iterations,
+                                                                                       self.hydraulic_erosion_iterations))
+
+        # Frees surfaces and chunks far away from the camera when memory runs over budget
+        self.chunk_residency = ChunkResidency(CHUNK_MEMORY_BUDGET)
+
+        # Pre-scaled chunk surfaces used when zoomed out, shared by all chunks
+        self.mipmaps = MipmapCache(MIPMAP_MEMORY_BUDGET)
+
+        # Keeps the last frame around so panning only draws what scrolled into view
+        self.viewport = Viewport() if VIEWPORT_BACKING else None
+
+        # Low detail terrain drawn instead of chunks when zoomed far out
+        self.lod = LodTerrain(self, generate_lod_data, (self.rand_seed_x, self.rand_seed_y, self.thermal_erosion_iterations,
+                                                         self.hydraulic_erosion_iterations), async_generation, pool=self.workers)
+
+        # Requests the chunks the camera is moving towards before they are in view
+        self.prefetcher = ChunkPrefetcher(self)
 
         self.chunk_coords = {}
         self.edge_chunks = set()
@@ -68,74 +273,261 @@ class World():
 
         #self.render_chunks()
 
+    @timefunc
     def update(self, delta: float) -> None:
-        looking_at_chunk = self.get_corresponding_chunk(self.camera.get_position())
-        chunk_pos = (int(looking_at_chunk.x), int(looking_at_chunk.y))
-        if chunk_pos not in self.chunks:
-            new_chunk = self.generate_chunk(looking_at_chunk)
-            new_chunk.render()
+        self.prefetcher.track(self.camera, delta)
+
+        if self.lod.is_active():
+            left, top, right, bottom = self.lod.visible_range()
+            self.rivers.update((left, top), (right - left + self.lod.size[0], bottom - top + self.lod.size[1]))
+            # Chunks are too small to see from here, don't spend any time on them
+            for generator in (self.chunk_generator, self.sketch_generator):
+                if generator is not None:
+                    for pos in generator.pending_keys():
+                        generator.cancel(pos)
+            self.lod.update()
+            self.chunk_residency.enforce(self)
+            return
+
+        visible = self.visible_chunk_range()
+        self.rivers.update((visible[0], visible[1]), (visible[2] - visible[0] + CHUNK_SIZE[0], visible[3] - visible[1] + CHUNK_SIZE[1]))
+
+        # Generate whatever is on screen, plus anything explicitly asked for
+        for chunk_pos in self.visible_chunk_keys(visible):
+            if chunk_pos not in self.chunks and not self.is_chunk_pending(chunk_pos):
+                self.request_chunk(chunk_pos)
+
+        # Chunks still waiting on their rivers, or refused for now, are asked for again next frame
+        waiting = set()
+        while len(self.edge_chunks) > 0:
+            chunk_pos = self.edge_chunks.pop()
+            if not self.request_chunk(chunk_pos):
+                waiting.add(chunk_pos)
+        self.edge_chunks = waiting
+
+        # Sketches on screen are made again with their rivers once those are in,
+        # after the chunks that aren't there at all
+        for chunk_pos in list(self.sketches):
+            if chunk_pos not in self.chunks:
+                # Evicted, it is made again from scratch when it comes back into view
+                self.sketches.discard(chunk_pos)
+            elif World.chunk_in_range(chunk_pos, visible) and not self.is_chunk_pending(chunk_pos):
+                self.request_chunk(chunk_pos, 1)
+
+        self.prefetcher.prefetch_rivers(visible)
+
+        if self.chunk_generator is not None:
+            # Queue what the camera is heading towards behind what is on screen
+            predicted = self.prefetcher.prefetch(visible)
+
+            # Chunks that scrolled off screen, or that the camera turned away from,
+            # before a worker got to them are not needed anymore
+            for generator in (self.chunk_generator, self.sketch_generator):
+                for pos in generator.pending_keys():
+                    if not World.chunk_in_range(pos, visible) and pos not in predicted:
+                        generator.cancel(pos)
+
+            finished = self.chunk_generator.poll(CHUNK_INTEGRATION_BUDGET)
+            for pos, (heights, tile_ids) in finished:
+                profiler.count("chunks_generated")
+                self.sketch_generator.cancel(pos)
+                new_chunk = self.add_chunk(pygame.Vector2(pos), heights, tile_ids)
+                if self.chunk_store is not None:
+                    self.chunk_store.save(pos, heights, tile_ids, new_chunk.content_hash)
+                new_chunk.render()
+
+            for pos, (heights, tile_ids) in self.sketch_generator.poll(CHUNK_INTEGRATION_BUDGET - len(finished)):
+                # The chunk with its rivers may have gotten there first
+                if pos not in self.chunks:
+                    profiler.count("chunk_sketches_generated")
+                    self.add_chunk(pygame.Vector2(pos), heights, tile_ids, sketch=True).render()
 
-            top    = (chunk_pos[0], chunk_pos[1] + CHUNK_SIZE[1])
-            bottom = (chunk_pos[0], chunk_pos[1] - CHUNK_SIZE[1])
-            left   = (chunk_pos[0] - CHUNK_SIZE[0], chunk_pos[1])
-            right  = (chunk_pos[0] + CHUNK_SIZE[0], chunk_pos[1])
+        self.chunk_residency.enforce(self)
+        #self.render_chunks()
 
-            for pos in (top, bottom, left, right):
-                if pos not in self.chunk_coords:
-                    self.edge_chunks.add(pos)
+    def visible_chunk_range(self, camera: Camera | None = None) -> tuple[int, int, int, int]:
+        """The keys of the top left and bottom right chunks that the camera
+        can see, as (left, top, right, bottom). Both ends are inclusive.
+        """
+        camera = camera or self.camera
+        top_left = self.get_corresponding_chunk(camera.screen_to_world(pygame.Vector2(0, 0)))
+        bottom_right = self.get_corresponding_chunk(camera.screen_to_world(pygame.Vector2(SCREEN_SIZE)))
+        return (int(top_left.x), int(top_left.y), int(bottom_right.x), int(bottom_right.y))
+
+    def visible_chunk_keys(self, visible: tuple[int, int, int, int] | None = None):
+        """Every chunk key in the camera's view, whether or not the chunk exists yet.
+        The cost only depends on the size of the view.
+        """
+        left, top, right, bottom = visible or self.visible_chunk_range()
+        for chunk_y in range(top, bottom + 1, CHUNK_SIZE[1]):
+            for chunk_x in range(left, right + 1, CHUNK_SIZE[0]):
+                yield (chunk_x, chunk_y)
 
-        else:
-            non_visible = set()
-            while len(self.edge_chunks) > 0:
-                new_pos = self.edge_chunks.pop()
-                screen_coord = self.camera.world_to_screen((new_pos[0], new_pos[1]))
-                bounds_rect = pygame.Rect(0, 0, CHUNK_SIZE[0] * TILE_SIZE[0], CHUNK_SIZE[1] * TILE_SIZE[1])
-                bounds_rect.w *= self.camera.scale
-                bounds_rect.h *= self.camera.scale
-                bounds_rect.topleft = screen_coord
-                # Don't do the work of scaling an image if it won't be on the screen
-                if not bounds_rect.colliderect(TileChunk.SCREEN_RECT):
-                    # non_visible.add(new_pos)
-                    continue
-                
-                new_chunk = self.generate_chunk(pygame.Vector2(new_pos))
-                new_chunk.render()
-                
-                top    = (new_pos[0], new_pos[1] + CHUNK_SIZE[1])
-                bottom = (new_pos[0], new_pos[1] - CHUNK_SIZE[1])
-                left   = (new_pos[0] - CHUNK_SIZE[0], new_pos[1])
-                right  = (new_pos[0] + CHUNK_SIZE[0], new_pos[1])
+    @staticmethod
+    def chunk_in_range(chunk_pos: tuple[int, int], visible: tuple[int, int, int, int]) -> bool:
+        left, top, right, bottom = visible
+        return left <= chunk_pos[0] <= right and top <= chunk_pos[1] <= bottom
+
+    def is_chunk_visible(self, chunk_pos: tuple[int, int]) -> bool:
+        return World.chunk_in_range(chunk_pos, self.visible_chunk_range())
+
+    def is_chunk_pending(self, chunk_pos: tuple[int, int]) -> bool:
+        return self.chunk_generator is not None and self.chunk_generator.is_pending(chunk_pos)
+
+    def request_chunk(self, chunk_pos: tuple[int, int], frames_ahead: int = 0) -> bool:
+        """Generate the chunk at chunk_pos. With a chunk generator the work
+        is queued for the worker processes, and the chunk shows up in a later
+        update. Chunks needed sooner go first, chunks on screen right away,
+        then closest to the camera. Without a generator it is generated and
+        rendered right away.
+
+        A chunk is only made once the river regions around it are worked out,
+        see RiverRegions. Until they are in, a sketch of the chunk made as if
+        there were no rivers stands in for it, and update makes the chunk
+        again once it is on screen and its rivers are in.
+
+        Returns False if a sketch has to wait for its rivers, or if
+        generating it failed too often and is refused for now, see
+        ChunkGenerator.is_failed. It has to be requested again in a later
+        frame.
+        """
+        if chunk_pos in self.chunks:
+            if chunk_pos not in self.sketches:
+                return True
+        elif self.load_chunk(chunk_pos) is not None:
+            return True
+        if self.chunk_generator is not None and self.chunk_generator.is_failed(chunk_pos):
+            return False
+
+        chunk_center = pygame.Vector2(chunk_pos[0] + CHUNK_SIZE[0] / 2, chunk_pos[1] + CHUNK_SIZE[1] / 2)
+        priority = (frames_ahead, chunk_center.distance_squared_to(self.camera.position))
+        rivers = self.rivers.gather(self.rivers.region_keys(*chunk_river_rect(chunk_pos)), priority)
+        if rivers is None:
+            if chunk_pos in self.chunks:
+                return False
+            if self.sketch_generator is None:
+                self.generate_chunk(pygame.Vector2(chunk_pos), skip_rivers=True).render()
+                return True
+            return self.sketch_generator.request(chunk_pos, priority, {"skip_rivers": True})
+
+        if self.chunk_generator is None:
+            # The regions are already in this process's RiverNetwork
+            self.generate_chunk(pygame.Vector2(chunk_pos)).render()
+            return True
+        return self.chunk_generator.request(chunk_pos, priority, {"rivers": rivers})
+
+    def load_chunk(self, chunk_pos: tuple[int, int]) -> TileChunk | None:
+        """Load a previously generated chunk from the chunk store. Returns
+        None if it has never been saved.
+        """
+        if self.chunk_store is None:
+            return None
 
-                for pos in (top, bottom, left, right):
-                    if pos not in self.chunks:
-                        non_visible.add(pos)
+        data = self.chunk_store.load(chunk_pos)
+        if data is None:
+            return None
 
-            self.edge_chunks = non_visible
-        #self.render_chunks()
+        heights, tile_ids = data
+        new_chunk = self.add_chunk(pygame.Vector2(chunk_pos), heights, tile_ids)
+        new_chunk.render()
+        return new_chunk
 
+    def close(self) -> None:
+        """Stop any background work and write out unsaved chunks"""
+        for generator in (self.chunk_generator, self.sketch_generator):
+            if generator is not None:
+                generator.shutdown()
+        self.rivers.close()
+        self.lod.close()
+        self.workers.shutdown()
+        if self.chunk_store is not None:
+            self.chunk_store.close()
 
     def generate(self) -> None:
         """Generates new terrain. Overwrites previous terrain."""
 
-        # TODO: Different maps (height, temperature, humidity) should be defined
-        # in their own classes, and combined in another class, and then the tiles 
-        # are instanciated and added to the chunk here
+        # Height, rivers, temperature and humidity are layers of self.fields,
+        # combined into tiles by calculate_tile_types
+
+        block_heights = {}
+        if self.heightmap_backend == "numpy":
+            # Generate the whole block in one go and slice it into chunks
+            block = generate_eroded_heightmap((0, 0), (5 * CHUNK_SIZE[0], 5 * CHUNK_SIZE[1]), self.rand_seed_x, self.rand_seed_y,
+                                              self.thermal_erosion_iterations, self.hydraulic_erosion_iterations)
+            block_heights = split_into_chunks(block)
 
         for x in range(5):
             for y in range(5):
                 position = pygame.Vector2(x * CHUNK_SIZE[0], y * CHUNK_SIZE[1])
-                self.generate_chunk(position)
+                self.generate_chunk(position, block_heights.get((int(position.x), int(position.y))))
                 print(position)
 
-    def generate_chunk(self, position):
-        heights = self.generate_heightmap(position)
-        humidity_map = [[0 for _ in range(CHUNK_SIZE[0])] for _ in range(CHUNK_SIZE[1])]
-        # humidity_map = World.calculate_humidity_map_ff(chunk_pos)
-        chunk_tiles = self.generate_tiles(position, heights, humidity_map)
-        new_chunk = TileChunk(position, chunk_tiles, self)
-        self.chunks[(int(position.x), int(position.y))] = new_chunk
+    @timefunc
+    def generate_chunk(self, position, heights=None, skip_rivers: bool = False):
+        """Generate the chunk at `position` on this thread. With `skip_rivers`
+        it is a sketch made as if there were no rivers, see request_chunk.
+        """
+        fields = self.fields
+        if skip_rivers:
+            fields = world_fields(self.rand_seed_x, self.rand_seed_y, self.thermal_erosion_iterations,
+                                  self.hydraulic_erosion_iterations, CHUNK_SIZE, False)
+        if heights is None:
+            if self.heightmap_backend == "numpy":
+                # Likely already generated as the neighbor of an earlier chunk
+                heights = fields.get("height", position)
+            else:
+                heights = self.generate_heightmap(position)
+        if not fields.contains("height", position):
+            fields.put("height", position, np.asarray(heights, dtype=np.float64))
+        tile_ids = World.calculate_tile_types(heights, fields.get("humidity", position), fields.get("temperature", position),
+                                              fields.get("river", position))
+        profiler.count("chunk_sketches_generated" if skip_rivers else "chunks_generated")
+        new_chunk = self.add_chunk(position, heights, tile_ids, sketch=skip_rivers)
+        if self.chunk_store is not None and not skip_rivers:
+            self.chunk_store.save(new_chunk.key, heights, tile_ids, new_chunk.content_hash)
+        return new_chunk
+
+    @property
+    def fields(self) -> FieldPipeline:
+        """Height, rivers, temperature and humidity of the chunks, see world_fields"""
+        return world_fields(self.rand_seed_x, self.rand_seed_y, self.thermal_erosion_iterations,
+                            self.hydraulic_erosion_iterations)
+
+    def add_chunk(self, position, heights, tile_ids, sketch: bool = False) -> TileChunk:
+        """Put a generated or loaded chunk in the world, replacing the one
+        that was there. `sketch` if it was made without rivers, see request_chunk
+        """
+        new_chunk = TileChunk(position, tile_ids, World.calculate_shade(heights), self)
+        new_chunk.content_hash = chunk_hash(self.seed, new_chunk.key, heights, tile_ids)
+        new_chunk.heights = np.asarray(heights)
+        self.chunks[new_chunk.key] = new_chunk
+        self.chunk_residency.add(new_chunk)
+        if sketch:
+            self.sketches.add(new_chunk.key)
+        else:
+            self.sketches.discard(new_chunk.key)
         return new_chunk
 
+    def set_tile(self, coord, tile_type) -> bool:
+        """Change the tile at a world (tile) coordinate to `tile_type`, a Tile
+        subclass or its id. Returns False if the chunk isn't loaded or the tile
+        already was that type. Only the changed tile gets drawn again.
+        """
+        chunk_pos = self.get_corresponding_chunk(coord)
+        chunk = self.chunks.get((int(chunk_pos.x), int(chunk_pos.y)))
+        if chunk is None:
+            return False
+        if not chunk.set_tile(int(coord[0] - chunk_pos.x), int(coord[1] - chunk_pos.y), tile_type):
+            return False
+
+        chunk.content_hash = chunk_hash(self.seed, chunk.key, chunk.heights, chunk.tile_ids)
+        # A changed sketch is kept the way it is, making it again would undo the change
+        self.sketches.discard(chunk.key)
+        if self.chunk_store is not None:
+            self.chunk_store.save(chunk.key, chunk.heights, chunk.tile_ids, chunk.content_hash)
+        self.lod.set_tile(coord, chunk.tile_ids[int(coord[1] - chunk_pos.y)][int(coord[0] - chunk_pos.x)])
+        return True
+
     def get_corresponding_chunk(self, coord):
         chunk_x = (coord[0] // CHUNK_SIZE[0]) * CHUNK_SIZE[0]
         chunk_y = (coord[1] // CHUNK_SIZE[1]) * CHUNK_SIZE[1]
@@ -143,33 +535,27 @@ class World():
 
     @staticmethod
     def calculate_tile(height, humidity, temperature=1.0):
-        """Determine a tile's type based on factors at a given location"""
-        if height < 0.25:
-            return Water
-        elif height < 0.30:
-            return Sand
-        elif height < 0.8:
-            if humidity < 0.4:
-                return Stone
-            if humidity < 0.5:
-                return Dirt
-            return Grass
-        elif height < 0.9:
-            if humidity < 0.8:
-                return Stone
-            return Snow
-        else:
-            if humidity < 0.3:
-                return Stone
-            return Snow
+        """Determine a tile's type based on factors at a given location, see BIOME_RULES"""
+        return TILE_TYPES[BIOMES.classify(height, humidity, temperature)]
 
     @timefunc
-    def generate_heightmap(self, position=(0, 0), chunk_size=CHUNK_SIZE, worley_vec1 = pygame.Vector2(127.5123, 247.124), worley_vec2=pygame.Vector2(523.216, 112.351)) -> list[list[float]]:
+    def generate_heightmap(self, position=(0, 0), chunk_size=CHUNK_SIZE):
+        """Generate the heights of the chunk at `position` using the backend
+        selected with `heightmap_backend`. Both return values indexed [y][x].
+        """
+        if self.heightmap_backend == "numpy":
+            return generate_eroded_heightmap(position, chunk_size, self.rand_seed_x, self.rand_seed_y,
+                                             self.thermal_erosion_iterations, self.hydraulic_erosion_iterations)
+        return self.generate_heightmap_scalar(position, chunk_size)
+
+    def generate_heightmap_scalar(self, position=(0, 0), chunk_size=CHUNK_SIZE, worley_vec1 = pygame.Vector2(127.5123, 247.124), worley_vec2=pygame.Vector2(523.216, 112.351)) -> list[list[float]]:
         # rand_x and rand_y are effectively the "seed" for the noise, but 
         # are more accurately the position from which we start looking at
         # the noise function
         rand_x = self.rand_seed_x
         rand_y = self.rand_seed_y
+        perlin = terrain_perlin(rand_x, rand_y)
+        worley = terrain_worley(tuple(worley_vec1), tuple(worley_vec2))
         terrain_scale = 8.0 # Higher = more fine detail for the base terrain
         perturb_scale = 20.0 # How detailed the perturbation is
 
@@ -188,9 +574,9 @@ class World():
                 # Add 3 octaves of noise for the perturbation. May be overkill but looks nice
                 perturb_noise_coord = pygame.Vector2((x + rand_x) * perturb_scale / WORLD_SIZE[0],
                                                      (y + rand_y) * perturb_scale / WORLD_SIZE[1])
-                perturb_amount = noise2D(*(perturb_noise_coord)) + \
-                                    0.50 * noise2D(*(perturb_noise_coord * 2)) + \
-                                    0.25 * noise2D(*(perturb_noise_coord * 4))
+                perturb_amount = noise2D(*(perturb_noise_coord), perlin) + \
+                                    0.50 * noise2D(*(perturb_noise_coord * 2), perlin) + \
+                                    0.25 * noise2D(*(perturb_noise_coord * 4), perlin)
                 perturb_amount /= (1 + 0.5 + 0.25) # Normalize range to [0, 1]
 
                 # How far away a coordinate can be offset by the perturbation
@@ -205,23 +591,21 @@ class World():
                 # Add 3 octaves of noise for the height. Add the pertub coordinate to the noise coordinate.
                 noise_coord = pygame.Vector2((x / WORLD_SIZE[0]) * terrain_scale + rand_x + perturb_x, 
                                              (y / WORLD_SIZE[1]) * terrain_scale + rand_y + perturb_y)
-                p_val = noise2D(*noise_coord) + \
-                        0.50 * noise2D(*(noise_coord * 2)) + \
-                        0.25 * noise2D(*(noise_coord * 4))
+                p_val = noise2D(*noise_coord, perlin) + \
+                        0.50 * noise2D(*(noise_coord * 2), perlin) + \
+                        0.25 * noise2D(*(noise_coord * 4), perlin)
                 p_val /= (1 + 0.5 + 0.25) # Normalize range to [0, 1]
 
-                large_scale_noise = (noise2D(*(noise_coord / 16)) + 0.5 * noise2D(*(noise_coord / 32))) / 1.5
+                large_scale_noise = (noise2D(*(noise_coord / 16), perlin) + 0.5 * noise2D(*(noise_coord / 32), perlin)) / 1.5
                 p_val += large_scale_noise
                 p_val /= 2.0
 
-                # # Add in some worley noise. Perturb to add variation to the straight lines of the texture
-                # worley_pos = pygame.Vector2((x + perturb_x) / WORLD_SIZE[0], 
-                #                             (y + perturb_y) / WORLD_SIZE[1])
-                # worley_dists = worley_noise(worley_pos, 4, 4, worley_vec1, worley_vec2)
-                # worley_val = worley_noise_val(worley_dists, [-1, 1])
+                # Add in some worley noise. Perturb to add variation to the straight lines of the texture
+                worley_f1, worley_f2 = worley.noise((x + perturb_x) / WORLD_SIZE[0] * WORLEY_CELLS + rand_x,
+                                                    (y + perturb_y) / WORLD_SIZE[1] * WORLEY_CELLS + rand_y)
 
                 # 2/3 perlin noise and 1/3 worley noise
-                # h_val = p_val * 0.66 + worley_val * 0.33
+                h_val = p_val * 0.66 + (worley_f2 - worley_f1) * 0.33
                 
                 # Distance from the center, divided by the distance to the closest edge. Will
                 # return 1 for coordinates on the midpoints of edges and > 1 for values closer to the corners
@@ -229,36 +613,37 @@ class World():
 
                 # don't remove much near the middle, only on the edges
                 # height = h_val - easeInExpo(radial_value)
-                heights[y_int][x_int] = p_val
+                heights[y_int][x_int] = h_val
 
         return heights
 
-    def generate_tiles(self, position, heights, humidity_map, chunk_size=CHUNK_SIZE):
-        tiles = [[None for _ in range(chunk_size[0])] for _ in range(chunk_size[1])]
-        for y in range(int(position[1]), int(position[1]) + chunk_size[1]):
-            for x in range(int(position[0]), int(position[0]) + chunk_size[0]):
-                height = heights[y % chunk_size[0]][x % chunk_size[1]]
-                fx, fy = x / WORLD_SIZE[0], y / WORLD_SIZE[1]
-                # rel_height controls the extra shadow drawn on the tiles. The lower the value the darker [0, 1]
-                # Adds a little bit of visual texture. No functional impact
-                rel_height = 1.0
-
-                tile_type = None
-
-                max_humidity_distance = WORLD_SIZE[0] / 10
-                humidity = 1.0 - (min(max_humidity_distance, humidity_map[y % chunk_size[0]][x % chunk_size[1]]) / max_humidity_distance)
-                humidity_add = fBm_noise(pygame.Vector2(fx, fy), 5, frequency=8.0)
-                humidity += humidity_add
-                humidity /= 2.0
-                tile_type = World.calculate_tile(height, humidity_add)
-                if height < 0.25:
-                    rel_height = max(0, height) / 0.25
-                else:
-                    rel_height = (height - 0.25) / 0.75
-                    
-                tiles[y % chunk_size[1]][x % chunk_size[0]] = tile_type(pygame.Vector2(x * self.tile_size, y * self.tile_size), self.tile_size, rel_height)
-
-        return tiles
+    def generate_tiles(self, heights, humidity, temperature, rivers=None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the tile ids and shade of a chunk, see TileChunk"""
+        tile_ids = World.calculate_tile_types(heights, humidity, temperature, rivers)
+        return tile_ids, World.calculate_shade(heights)
+
+    @staticmethod
+    def calculate_tile_types(heights, humidity, temperature, rivers=None) -> np.ndarray:
+        """Decide the type of every tile in a chunk from its height, humidity
+        and temperature layers, see world_fields. Tiles in the `rivers` mask
+        are water whatever their height. Returns an array of ids into
+        TILE_TYPES indexed [y][x]. Doesn't touch any pygame surfaces, so it is
+        safe to run in a worker process.
+        """
+        tile_ids = BIOMES.classify(heights, humidity, temperature)
+        if rivers is not None:
+            tile_ids[np.asarray(rivers, dtype=bool)] = TILE_IDS[Water]
+        return tile_ids
+
+    @staticmethod
+    def calculate_shade(heights) -> np.ndarray:
+        """The alpha of the shadow drawn over every tile, see Tile.shadow_alpha"""
+        heights = np.asarray(heights, dtype=np.float64)
+
+        # rel_height controls the extra shadow drawn on the tiles. The lower the value the darker [0, 1]
+        # Adds a little bit of visual texture. No functional impact
+        rel_height = np.where(heights < 0.25, np.maximum(0, heights) / 0.25, (heights - 0.25) / 0.75)
+        return np.clip(np.trunc((1.0 - rel_height) * 127), 0, 255).astype(np.uint8)
 
     @staticmethod
     def get_moore_neighborhood(array, coord: pygame.Vector2) -> list:
@@ -296,39 +681,28 @@ class World():
     def thermal_erosion(height_map: list[list[float]], iterations: int) -> None:
         """Iterate over a height map and simulate thermal erosion. This involves
         reducing moving material from very steep areas to the surrounding areas.
+        Modifies `height_map` in place, see erosion.thermal_erosion_array.
         """
 
-        T = 4 / WORLD_SIZE[0]
-        for i in range(iterations):
-            print(f"Thermal erosion iteration {i+1}")
-            adjusted = False
-            for row_y, row in enumerate(height_map):
-                for row_x, height in enumerate(row):
-                    neighbors = World.get_vnn_neighborhood(height_map, pygame.Vector2(row_x, row_y))
-                    delta_total = 0
-                    delta_max = 0
-                    move_to_cells = []
-                    for neighbor_coord in neighbors:
-                        delta = height - height_map[neighbor_coord[1]][neighbor_coord[0]]
-                        if delta > T:
-                            delta_total += delta
-                            delta_max = max(delta, delta_max)
-                            move_to_cells.append((neighbor_coord, delta))
-                            
-
-                    for coord, dt in move_to_cells:
-                        adjust = 0.05 * (delta_max - T) * (dt / delta_total)
-                        height_map[coord[1]][coord[0]] += adjust
-                        height_map[row_y][row_x] -= adjust
-                        adjusted = True
-
-            if not adjusted:
-                break
+        eroded, _ = thermal_erosion_array(height_map, iterations)
+        for row_y, row in enumerate(eroded):
+            height_map[row_y][:] = row.tolist()
 
     @timefunc
     @staticmethod
-    def hydraulic_erosion(array) -> None:
-        NotImplemented
+    def hydraulic_erosion(height_map: list[list[float]], iterations: int, workers: int = 1) -> None:
+        """Simulate rain washing material down slopes and depositing it where
+        the water slows down. Modifies `height_map` in place. With more than
+        one worker the map is split into regions that are eroded in separate
+        processes, see erosion.hydraulic_erosion_regions.
+        """
+
+        if workers > 1:
+            eroded = hydraulic_erosion_regions(height_map, iterations, max_workers=workers)
+        else:
+            eroded, _ = hydraulic_erosion_array(height_map, iterations)
+        for row_y, row in enumerate(eroded):
+            height_map[row_y][:] = row.tolist()
 
     @timefunc
     @staticmethod
@@ -340,38 +714,9 @@ class World():
 
         assert len(heights) > 0 and len(heights[0]) > 0
 
-        size_x = len(heights)
-        size_y = len(heights[0])
-
-        output = [[None for _ in range(size_x)] for _ in range(size_y)]
-        unseen = set(list((x, y) for x in range(size_x) for y in range(size_y)))
-        
-        # Step 1: Add all water as edge tiles
-        edges = set()
-        for x in range(size_x):
-            for y in range(size_y):
-                # Just look at water first
-                if heights[x][y] < water_height:
-                    output[x][y] = 0
-
-                    unseen.remove((x, y))
-                    edges.add((x, y))
-
-        # Use flood fill to expand from the edge of water one tile at a time
-        distance = 1
-        while len(unseen) > 0:
-            old_edges = list(edges)
-            # Empty edges, because we want to look at each 'ring' of distances one at a time
-            edges = set()
-            for edge in old_edges:
-                for coord in World.get_vnn_neighborhood(heights, edge):
-                    if coord in unseen:
-                        edges.add(coord)
-                        unseen.remove(coord)
-                        output[coord[0]][coord[1]] = distance
-            distance += 1
-
-        return output
+        distances = distance_transform_l1(np.asarray(heights) < water_height)
+        # Without any water there is no distance to it
+        return [[None if math.isinf(d) else int(d) for d in row] for row in distances.tolist()]
 
     @timefunc
     def render_chunks(self) -> None:
@@ -381,8 +726,63 @@ class World():
         for chunk_pos in self.chunks:
             self.chunks[chunk_pos].render()
 
+    def chunk_screen_rect(self, chunk_pos: tuple[int, int]) -> pygame.Rect:
+        """Where the chunk at chunk_pos ends up on the screen, whether or not it exists"""
+        # Scaled chunk surfaces are rounded up, see TileChunk.rescale
+        size = (math.ceil(CHUNK_SIZE[0] * TILE_SIZE[0] * self.camera.scale), math.ceil(CHUNK_SIZE[1] * TILE_SIZE[1] * self.camera.scale))
+        screen_coord = self.camera.world_to_screen(pygame.Vector2(chunk_pos))
+        return pygame.Rect((int(screen_coord.x), int(screen_coord.y)), size)
+
+    def chunk_state(self, chunk_pos: tuple[int, int]) -> int:
+        """Changes whenever what is drawn for the chunk at chunk_pos changes: the
+        chunk's version once it exists, -1 for the low detail stand in, -2 for nothing
+        """
+        chunk = self.chunks.get(chunk_pos)
+        if chunk is not None:
+            return chunk.version
+        if self.lod.super_chunks.get(self.lod.get_super_chunk_key(chunk_pos)) is not None:
+            return -1
+        return -2
+
+    def chunk_blits(self) -> dict:
+        """The (surface, position) pairs of everything in view, keyed by chunk,
+        in the order they should be drawn. Chunks that haven't been generated
+        yet are stood in for by the low detail terrain.
+        """
+        blits = {}
+        for chunk_pos in self.visible_chunk_keys():
+            chunk = self.chunks.get(chunk_pos)
+            if chunk is not None:
+                blit = chunk.blit_source(self.camera)
+            else:
+                # Popped in late, prefetching should keep this near zero while panning
+                profiler.count("chunks_missing")
+                blit = self.lod.placeholder(chunk_pos)
+            if blit is not None:
+                blits[chunk_pos] = blit
+        return blits
+
+    @timefunc
     def draw(self, surface: pygame.Surface) -> None:
-        """Draw the whole world, by going through each chunk"""
+        """Draw the world, by going through each chunk in view"""
 
-        for chunk_pos in self.chunks:
-            self.chunks[chunk_pos].draw(surface, self.camera)
+        if self.lod.is_active():
+            self.lod.draw(surface)
+            if self.viewport is not None:
+                self.viewport.invalidate()
+            return
+
+        if self.viewport is not None:
+            with profiler.timer("blit"):
+                self.viewport.draw(self, surface)
+        else:
+            blits = self.chunk_blits()
+            # One call for every chunk instead of one blit each
+            with profiler.timer("blit"):
+                surface.blits(list(blits.values()), doreturn=False)
+            profiler.count("chunks_drawn", len(blits))
+
+        if DRAW_CHUNK_OUTLINES:
+            for chunk_pos in self.visible_chunk_keys():
+                if chunk_pos in self.chunks:
+                    pygame.draw.rect(surface, (255, 0, 0), self.chunks[chunk_pos].get_bounds(self.camera), 1)
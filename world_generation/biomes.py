@@ -0,0 +1,83 @@
+import numpy as np
+
+from tiles import Water, Sand, Dirt, Grass, Stone, Snow, TILE_IDS
+
+# Which tile goes where. The first rule that matches a tile decides its type.
+# Every rule limits some of the fields to [low, high), None leaves that end
+# open, and fields that aren't mentioned can be anything. The last rule has
+# to match everything that is left.
+BIOME_RULES = [
+    (Water, {"height": (None, 0.25)}),
+    (Sand,  {"height": (None, 0.30)}),
+    # Frozen over
+    (Snow,  {"height": (None, 0.8), "temperature": (None, 0.15)}),
+    (Stone, {"height": (None, 0.8), "humidity": (None, 0.4)}),
+    (Dirt,  {"height": (None, 0.8), "humidity": (None, 0.5)}),
+    (Grass, {"height": (None, 0.8)}),
+    (Stone, {"height": (None, 0.9), "humidity": (None, 0.8)}),
+    (Snow,  {"height": (None, 0.9)}),
+    (Stone, {"humidity": (None, 0.3)}),
+    (Snow,  {}),
+]
+
+class BiomeTable:
+    """Classifies whole arrays of tiles at once with a lookup table made
+    from a list of rules like BIOME_RULES.
+
+    Every threshold in the rules splits its field into bins, and no rule can
+    change its mind inside a bin. So the rules are evaluated once for every
+    combination of bins when the table is made, and classifying a tile is
+    just finding its bin in each field. That costs the same however many
+    rules there are.
+    """
+
+    FIELDS = ("height", "humidity", "temperature")
+
+    def __init__(self, rules):
+        for _, bounds in rules:
+            for field in bounds:
+                if field not in BiomeTable.FIELDS:
+                    raise ValueError(f"Unknown biome field {field!r}")
+
+        # The thresholds of every field, sorted. Bin i of a field holds the values
+        # between thresholds i - 1 and i
+        self.thresholds = []
+        for field in BiomeTable.FIELDS:
+            values = {bound for _, bounds in rules if field in bounds for bound in bounds[field] if bound is not None}
+            self.thresholds.append(np.array(sorted(values), dtype=np.float64))
+
+        # A value that lands in each bin, to try the rules with
+        samples = [BiomeTable._bin_samples(thresholds) for thresholds in self.thresholds]
+        grids = dict(zip(BiomeTable.FIELDS, np.meshgrid(*samples, indexing="ij")))
+
+        self.table = np.zeros(grids["height"].shape, dtype=np.uint8)
+        unmatched = np.ones(self.table.shape, dtype=bool)
+        for tile_type, bounds in rules:
+            matches = unmatched.copy()
+            for field, (low, high) in bounds.items():
+                if low is not None:
+                    matches &= grids[field] >= low
+                if high is not None:
+                    matches &= grids[field] < high
+            self.table[matches] = TILE_IDS[tile_type]
+            unmatched &= ~matches
+
+        if unmatched.any():
+            raise ValueError("Some tiles don't match any biome rule, the last rule should match everything")
+
+    @staticmethod
+    def _bin_samples(thresholds: np.ndarray) -> np.ndarray:
+        if len(thresholds) == 0:
+            return np.zeros(1)
+        middles = (thresholds[:-1] + thresholds[1:]) / 2
+        return np.concatenate(([thresholds[0] - 1.0], middles, [thresholds[-1] + 1.0]))
+
+    def classify(self, heights, humidity, temperature) -> np.ndarray:
+        """Tile ids into TILE_TYPES for arrays of heights, humidities and
+        temperatures of the same shape
+        """
+        bins = [np.searchsorted(thresholds, np.asarray(values, dtype=np.float64), side="right")
+                for thresholds, values in zip(self.thresholds, (heights, humidity, temperature))]
+        return self.table[tuple(bins)]
+
+BIOMES = BiomeTable(BIOME_RULES)
@@ -0,0 +1,108 @@
+import numpy as np
+
+def _distance_1d(values: np.ndarray, axis: int) -> np.ndarray:
+    """min over j of values[j] + |i - j| along `axis`, for every i. Done as
+    a running minimum from both ends, so it is linear in the size of the
+    array.
+    """
+    values = np.moveaxis(values, axis, -1)
+    index = np.arange(values.shape[-1], dtype=np.float64)
+
+    # Forward: min over j <= i of values[j] - j, plus i
+    forward = np.minimum.accumulate(values - index, axis=-1) + index
+    # Backward: min over j >= i of values[j] + j, minus i
+    backward = np.minimum.accumulate((values + index)[..., ::-1], axis=-1)[..., ::-1] - index
+
+    return np.moveaxis(np.minimum(forward, backward), -1, axis)
+
+def distance_transform_l1(mask) -> np.ndarray:
+    """Manhattan distance from every cell to the nearest True cell of `mask`.
+    This is the same distance a flood fill through the von Neumann
+    neighborhood gives. inf where there is no True cell at all.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    distances = np.where(mask, 0.0, np.inf)
+    # L1 distance is separable, do the rows and then the columns
+    return _distance_1d(_distance_1d(distances, 1), 0)
+
+def _lower_envelope(squared: np.ndarray) -> np.ndarray:
+    """min over j of squared[y][j] + (x - j)^2 for every row y and column x.
+
+    This is the lower envelope of one parabola per column from Felzenszwalb
+    and Huttenlocher's "Distance Transforms of Sampled Functions", linear in
+    the number of columns. All rows are done together, so the loops only run
+    once per column, not once per cell.
+    """
+    rows, cols = squared.shape
+    row_index = np.arange(rows)
+    columns = np.arange(cols, dtype=np.float64)
+    # Per row, the columns of the parabolas in the envelope and where each one starts
+    parabolas = np.zeros((rows, cols), dtype=np.intp)
+    starts = np.full((rows, cols + 1), np.inf)
+    last = np.full(rows, -1, dtype=np.intp) # Index of the last parabola in the envelope, -1 while empty
+
+    for q in range(cols):
+        value = squared[:, q] + q * q
+        # A column with no True cell in it is no parabola at all
+        adding = np.flatnonzero(np.isfinite(value))
+        if len(adding) == 0:
+            continue
+
+        first = adding[last[adding] < 0]
+        parabolas[first, 0] = q
+        starts[first, 0] = -np.inf
+        starts[first, 1] = np.inf
+        last[first] = 0
+
+        adding = adding[last[adding] >= 0]
+        adding = adding[parabolas[adding, last[adding]] != q]
+        # Drop parabolas from the end of the envelope while the new one hides them
+        pending = adding
+        while len(pending):
+            top = parabolas[pending, last[pending]]
+            crossing = ((value[pending] - squared[pending, top] - top * top) / (2 * (q - top)))
+            hidden = crossing <= starts[pending, last[pending]]
+            last[pending[hidden]] -= 1
+            pending = pending[hidden]
+
+        if len(adding):
+            top = parabolas[adding, last[adding]]
+            crossing = ((value[adding] - squared[adding, top] - top * top) / (2 * (q - top)))
+            last[adding] += 1
+            parabolas[adding, last[adding]] = q
+            starts[adding, last[adding]] = crossing
+            starts[adding, last[adding] + 1] = np.inf
+
+    # Read the envelope back, every row moving through its parabolas from left to right
+    result = np.full((rows, cols), np.inf)
+    has_envelope = row_index[last >= 0]
+    current = np.zeros(rows, dtype=np.intp)
+    for x in range(cols):
+        pending = has_envelope
+        while len(pending):
+            passed = starts[pending, current[pending] + 1] < x
+            current[pending[passed]] += 1
+            pending = pending[passed]
+        column = parabolas[has_envelope, current[has_envelope]]
+        result[has_envelope, x] = (columns[x] - column) ** 2 + squared[has_envelope, column]
+    return result
+
+def distance_transform_euclidean(mask) -> np.ndarray:
+    """Exact Euclidean distance from every cell to the nearest True cell of
+    `mask`, inf where there is no True cell at all.
+
+    First the vertical distance to the nearest True cell in the same column,
+    then for every cell the best column to get there through, see
+    _lower_envelope. Both steps are linear in the number of cells.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    vertical = _distance_1d(np.where(mask, 0.0, np.inf), 0)
+    return np.sqrt(_lower_envelope(vertical ** 2))
+
+def distance_transform(mask, metric: str = "manhattan") -> np.ndarray:
+    """Distance to the nearest True cell, either "manhattan" or "euclidean"."""
+    if metric == "manhattan":
+        return distance_transform_l1(mask)
+    if metric == "euclidean":
+        return distance_transform_euclidean(mask)
+    raise ValueError(f"Unknown distance metric {metric!r}")
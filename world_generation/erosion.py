@@ -0,0 +1,198 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from globals import WORLD_SIZE
+
+# Slope above which material starts to slide, same as World.thermal_erosion
+THERMAL_TALUS = 4 / WORLD_SIZE[0]
+# Fraction of the excess slope that moves each iteration
+THERMAL_RATE = 0.05
+
+# Divisor for cells that don't send anything anywhere. Dividing by it keeps
+# the array code free of masks, which are a lot slower than plain arithmetic
+_TINY = np.finfo(np.float64).tiny
+
+# Defaults for hydraulic_erosion_step, heights are in the 0-1 range
+HYDRAULIC_PARAMS = {
+    "rain": 0.002, # Water added to every cell each iteration
+    "capacity": 2.0, # Sediment a unit of flowing water can carry
+    "erosion": 0.3, # Fraction of the missing sediment picked up each iteration
+    "deposition": 0.3, # Fraction of the excess sediment dropped each iteration
+    "evaporation": 0.05, # Fraction of the water that evaporates each iteration
+}
+
+def _neighbor_deltas(heights: np.ndarray) -> np.ndarray:
+    """Height difference between every cell and its left, right, up and down
+    neighbor, shape (4, rows, cols). Cells on the border have no neighbor on
+    one side, the difference there is 0 so nothing moves off the map.
+    """
+    deltas = np.zeros((4,) + heights.shape)
+    np.subtract(heights[:, 1:], heights[:, :-1], out=deltas[0, :, 1:])  # left
+    np.negative(deltas[0, :, 1:], out=deltas[1, :, :-1])                # right
+    np.subtract(heights[1:, :], heights[:-1, :], out=deltas[2, 1:, :])  # up
+    np.negative(deltas[2, 1:, :], out=deltas[3, :-1, :])                # down
+    return deltas
+
+def _receive(target: np.ndarray, moved: np.ndarray) -> None:
+    """Add what every cell sends to its left, right, up and down neighbor
+    (shape (4, rows, cols), same order as _neighbor_deltas) to the
+    neighbor's cell of `target`.
+    """
+    target[:, :-1] += moved[0, :, 1:]
+    target[:, 1:] += moved[1, :, :-1]
+    target[:-1, :] += moved[2, 1:, :]
+    target[1:, :] += moved[3, :-1, :]
+
+def thermal_erosion_step(heights: np.ndarray, talus: float = THERMAL_TALUS, rate: float = THERMAL_RATE) -> float:
+    """One iteration of thermal erosion over the whole array at once,
+    modifying `heights` in place. Every cell hands material to its lower
+    von Neumann neighbors in proportion to how much steeper than `talus` the
+    slope to them is. Returns the largest amount moved out of a single cell.
+    """
+    deltas = _neighbor_deltas(heights)
+    deltas *= deltas > talus
+
+    delta_total = deltas.sum(axis=0)
+    # Material moved from every cell to each of its neighbors, in proportion to the slope
+    excess = rate * np.maximum(deltas.max(axis=0) - talus, 0.0)
+    moved = deltas * (excess / np.maximum(delta_total, _TINY))
+
+    outflow = moved.sum(axis=0)
+    heights -= outflow
+    _receive(heights, moved)
+
+    return float(outflow.max()) if outflow.size else 0.0
+
+def thermal_erosion_array(heights, iterations: int, talus: float = THERMAL_TALUS, rate: float = THERMAL_RATE,
+                          tolerance: float = 0.0) -> tuple[np.ndarray, int]:
+    """Array version of World.thermal_erosion. Returns the eroded heights and
+    the number of iterations that were run, which is less than `iterations`
+    when the map settles early (nothing moves by more than `tolerance`).
+
+    Unlike the scalar version every cell is updated from the heights of the
+    previous iteration, so the result doesn't depend on the order cells are
+    visited in.
+    """
+    heights = np.array(heights, dtype=np.float64)
+    for i in range(iterations):
+        if thermal_erosion_step(heights, talus, rate) <= tolerance:
+            return heights, i + 1
+    return heights, iterations
+
+def thermal_erosion_halo(iterations: int) -> int:
+    """How many tiles of overlap a chunk needs on each side for chunk-local
+    erosion to match eroding the whole world. A cell's new height depends on
+    its neighbors' neighbors, so every iteration reaches two tiles further.
+    """
+    return 2 * iterations
+
+def erode_chunk(heights_with_halo: np.ndarray, halo: int, iterations: int, talus: float = THERMAL_TALUS,
+                rate: float = THERMAL_RATE) -> np.ndarray:
+    """Erode a chunk that was generated with `halo` extra tiles on every side
+    and return just the chunk. With halo >= thermal_erosion_halo(iterations)
+    the chunk is exactly what eroding the whole world would give, so
+    neighboring chunks line up without a seam.
+
+    Stopping early when the window settles is still exact, since running more
+    iterations on a settled window doesn't change anything.
+    """
+    eroded, _ = thermal_erosion_array(heights_with_halo, iterations, talus, rate)
+    if halo == 0:
+        return eroded
+    return eroded[halo:-halo, halo:-halo]
+
+def hydraulic_erosion_step(heights: np.ndarray, water: np.ndarray, sediment: np.ndarray, rain: float, capacity: float,
+                           erosion: float, deposition: float, evaporation: float) -> float:
+    """One iteration of grid based hydraulic erosion, modifying all three
+    arrays in place. Rain is added, water runs off to lower neighbors, and
+    the water picks up or drops sediment depending on how fast it flows.
+    Returns the largest amount of water that left a single cell.
+    """
+    water += rain
+
+    deltas = _neighbor_deltas(heights + water)
+    np.maximum(deltas, 0.0, out=deltas)
+    delta_total = np.maximum(deltas.sum(axis=0), _TINY)
+
+    # Moving more than half the drop would just make the water slosh back
+    flow = np.minimum(water, deltas.max(axis=0) * 0.5)
+
+    # Fast water carries more, so steep runoff digs in and slow water fills in
+    missing = capacity * flow - sediment
+    picked_up = erosion * np.maximum(missing, 0.0) + deposition * np.minimum(missing, 0.0)
+    heights -= picked_up
+    sediment += picked_up
+
+    # Sediment leaves together with the water it is suspended in
+    carried = sediment * flow / np.maximum(water, _TINY)
+    water -= flow
+    sediment -= carried
+    # Both are split between the lower neighbors in proportion to the drop
+    _receive(water, deltas * (flow / delta_total))
+    _receive(sediment, deltas * (carried / delta_total))
+
+    water *= 1.0 - evaporation
+
+    return float(flow.max()) if flow.size else 0.0
+
+def hydraulic_erosion_array(heights, iterations: int, tolerance: float = 0.0, **params) -> tuple[np.ndarray, int]:
+    """Run hydraulic erosion on a height map for up to `iterations`
+    iterations and return the eroded heights and the number of iterations
+    run. Any keyword from HYDRAULIC_PARAMS can be overridden. Whatever
+    sediment is still suspended at the end is dropped where it is.
+    """
+    params = dict(HYDRAULIC_PARAMS, **params)
+    heights = np.array(heights, dtype=np.float64)
+    water = np.zeros_like(heights)
+    sediment = np.zeros_like(heights)
+
+    run = iterations
+    for i in range(iterations):
+        if hydraulic_erosion_step(heights, water, sediment, **params) <= tolerance:
+            run = i + 1
+            break
+
+    heights += sediment
+    return heights, run
+
+def hydraulic_erosion_halo(iterations: int) -> int:
+    """Same as thermal_erosion_halo, water and sediment also only travel one
+    tile per iteration and a cell's outflow depends on its neighbors.
+    """
+    return 2 * iterations
+
+def _erode_region(window: np.ndarray, crop: tuple[int, int, int, int], iterations: int, params: dict) -> np.ndarray:
+    eroded, _ = hydraulic_erosion_array(window, iterations, **params)
+    top, bottom, left, right = crop
+    return eroded[top:bottom, left:right]
+
+def hydraulic_erosion_regions(heights, iterations: int, region_size: int = 64, halo: int | None = None,
+                              max_workers: int | None = None, **params) -> np.ndarray:
+    """hydraulic_erosion_array split into independent regions of
+    `region_size` tiles that are eroded in separate processes.
+
+    Every region is eroded together with `halo` tiles around it. The default
+    halo makes the result identical to eroding the whole map at once. A
+    smaller halo is faster, at the cost of small differences along the
+    region borders.
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    if halo is None:
+        halo = hydraulic_erosion_halo(iterations)
+    rows, cols = heights.shape
+
+    jobs = []
+    for y in range(0, rows, region_size):
+        for x in range(0, cols, region_size):
+            top, left = max(0, y - halo), max(0, x - halo)
+            bottom, right = min(rows, y + region_size + halo), min(cols, x + region_size + halo)
+            crop = (y - top, y - top + min(region_size, rows - y), x - left, x - left + min(region_size, cols - x))
+            jobs.append(((y, x), (heights[top:bottom, left:right], crop, iterations, params)))
+
+    result = np.empty_like(heights)
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = [((y, x), executor.submit(_erode_region, *args)) for (y, x), args in jobs]
+        for (y, x), future in futures:
+            region = future.result()
+            result[y:y + region.shape[0], x:x + region.shape[1]] = region
+    return result
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+from globals import CHUNK_SIZE
+
+class FieldPipeline:
+    """Chunk sized arrays of a value that varies over the world (height,
+    temperature, humidity, ...), built on top of each other.
+
+    Every layer is a function called as func(fields, chunk_pos) that returns
+    an array indexed [y][x], and the layers it reads with `fields.get`
+    have to be declared when it is added. Layers can read other chunks than
+    their own, the distance to water for example looks at the heights of the
+    chunks around it.
+
+    Each layer is computed once per chunk and kept in a least recently used
+    cache of `max_chunks` chunks, so any number of layers and callers can
+    read the same layer without computing it again.
+    """
+
+    def __init__(self, max_chunks: int = 512, chunk_size=CHUNK_SIZE):
+        self.max_chunks = max_chunks
+        self.chunk_size = chunk_size
+        self._layers = {} # name -> (func, dependencies)
+        self._cache = {} # name -> OrderedDict of chunk pos -> array
+        self._computing = [] # Names of the layers being computed, innermost last
+
+    def add(self, name: str, func, depends: tuple[str, ...] = ()) -> None:
+        """Add a layer. The layers it depends on have to be added first, so
+        there can't be cycles.
+        """
+        if name in self._layers:
+            raise ValueError(f"Field layer {name!r} already exists")
+        for dependency in depends:
+            if dependency not in self._layers:
+                raise ValueError(f"Field layer {name!r} depends on {dependency!r}, which hasn't been added")
+        self._layers[name] = (func, tuple(depends))
+        self._cache[name] = OrderedDict()
+
+    def layers(self) -> list[str]:
+        """Layer names, every layer after the ones it depends on"""
+        return list(self._layers)
+
+    def dependents(self, name: str) -> set[str]:
+        """Every layer that reads `name`, directly or through another layer"""
+        found = set()
+        for layer, (_, depends) in self._layers.items():
+            if name in depends or found.intersection(depends):
+                found.add(layer)
+        return found
+
+    def get(self, name: str, chunk_pos: tuple[int, int]):
+        """Layer `name` of the chunk at `chunk_pos`, computed if it isn't cached"""
+        if self._computing and name not in self._layers[self._computing[-1]][1]:
+            raise ValueError(f"Field layer {self._computing[-1]!r} reads {name!r} without depending on it")
+
+        key = (int(chunk_pos[0]), int(chunk_pos[1]))
+        cache = self._cache[name]
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        func, _ = self._layers[name]
+        self._computing.append(name)
+        try:
+            value = func(self, key)
+        finally:
+            self._computing.pop()
+        self.put(name, key, value)
+        return value
+
+    def put(self, name: str, chunk_pos: tuple[int, int], value) -> None:
+        """Store a layer that was computed some other way, like heights
+        generated for a whole block of chunks at once
+        """
+        key = (int(chunk_pos[0]), int(chunk_pos[1]))
+        cache = self._cache[name]
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_chunks:
+            cache.popitem(last=False)
+
+    def contains(self, name: str, chunk_pos: tuple[int, int]) -> bool:
+        return (int(chunk_pos[0]), int(chunk_pos[1])) in self._cache[name]
+
+    def invalidate(self, name: str, chunk_pos: tuple[int, int]) -> None:
+        """Forget layer `name` of a chunk, and the layers built on it"""
+        key = (int(chunk_pos[0]), int(chunk_pos[1]))
+        for layer in {name} | self.dependents(name):
+            self._cache[layer].pop(key, None)
+
+    def clear(self) -> None:
+        for cache in self._cache.values():
+            cache.clear()
@@ -0,0 +1,111 @@
+import functools
+import math
+import numpy as np
+
+from globals import WORLD_SIZE, CHUNK_SIZE
+from world_generation.noise import fBm_noise_array
+from world_generation.perlin import Perlin
+from world_generation.worley import WorleyNoise
+from world_generation.erosion import thermal_erosion_halo, thermal_erosion_array, hydraulic_erosion_halo, hydraulic_erosion_array
+
+# Worley cells across WORLD_SIZE, and the vectors its feature points are hashed with
+WORLEY_CELLS = 4
+WORLEY_SEED_VEC1 = (127.5123, 247.124)
+WORLEY_SEED_VEC2 = (523.216, 112.351)
+
+@functools.lru_cache(maxsize=4)
+def terrain_perlin(rand_x: float, rand_y: float) -> Perlin:
+    """The Perlin noise the terrain is made from. rand_x and rand_y are what
+    the world seed turns into for the terrain, so the noise tables are seeded
+    from them as well and nothing more has to be passed to worker processes.
+    """
+    return Perlin(f"{rand_x!r}:{rand_y!r}")
+
+@functools.lru_cache(maxsize=4)
+def terrain_worley(seed_vec1: tuple[float, float] = WORLEY_SEED_VEC1, seed_vec2: tuple[float, float] = WORLEY_SEED_VEC2) -> WorleyNoise:
+    """The Worley noise the terrain is made from, shared between chunks"""
+    return WorleyNoise(seed_vec1, seed_vec2)
+
+def noise2D_array(x: np.ndarray, y: np.ndarray, perlin: Perlin) -> np.ndarray:
+    """Array version of world.noise2D"""
+    return perlin.noise_array(x, y) + 0.5
+
+def generate_heightmap_array(position=(0, 0), size=CHUNK_SIZE, rand_x: float = 0.0, rand_y: float = 0.0) -> np.ndarray:
+    """Batched version of World.generate_heightmap. Computes the heights of a
+    whole rectangle of tiles at once instead of one tile at a time.
+
+    `size` does not have to be a single chunk, a block of chunks can be
+    generated in one call and sliced apart afterwards. The result is indexed
+    [y][x] like the scalar version.
+    """
+    terrain_scale = 8.0 # Higher = more fine detail for the base terrain
+    perturb_scale = 20.0 # How detailed the perturbation is
+
+    perlin = terrain_perlin(rand_x, rand_y)
+
+    xs = np.arange(size[0], dtype=np.float64) + position[0]
+    ys = np.arange(size[1], dtype=np.float64) + position[1]
+    x, y = np.meshgrid(xs, ys)
+
+    # Perturbing will adjust what coordinate we're looking at in the noise function
+    perturb_x = (x + rand_x) * perturb_scale / WORLD_SIZE[0]
+    perturb_y = (y + rand_y) * perturb_scale / WORLD_SIZE[1]
+    perturb_amount = noise2D_array(perturb_x, perturb_y, perlin) + \
+                        0.50 * noise2D_array(perturb_x * 2, perturb_y * 2, perlin) + \
+                        0.25 * noise2D_array(perturb_x * 4, perturb_y * 4, perlin)
+    perturb_amount /= (1 + 0.5 + 0.25) # Normalize range to [0, 1]
+
+    # How far away a coordinate can be offset by the perturbation
+    perturb_range = fBm_noise_array(x, y, 5, frequency=8) * 0.3
+
+    angle = math.pi * 2 * perturb_amount
+    offset_x = np.cos(angle) * perturb_range
+    offset_y = np.sin(angle) * perturb_range
+
+    noise_x = (x / WORLD_SIZE[0]) * terrain_scale + rand_x + offset_x
+    noise_y = (y / WORLD_SIZE[1]) * terrain_scale + rand_y + offset_y
+    p_val = noise2D_array(noise_x, noise_y, perlin) + \
+            0.50 * noise2D_array(noise_x * 2, noise_y * 2, perlin) + \
+            0.25 * noise2D_array(noise_x * 4, noise_y * 4, perlin)
+    p_val /= (1 + 0.5 + 0.25) # Normalize range to [0, 1]
+
+    large_scale_noise = (noise2D_array(noise_x / 16, noise_y / 16, perlin) + 0.5 * noise2D_array(noise_x / 32, noise_y / 32, perlin)) / 1.5
+    p_val += large_scale_noise
+    p_val /= 2.0
+
+    # Add in some worley noise. Perturb to add variation to the straight lines of the texture
+    f1, f2 = terrain_worley().noise_array((x + offset_x) / WORLD_SIZE[0] * WORLEY_CELLS + rand_x,
+                                          (y + offset_y) / WORLD_SIZE[1] * WORLEY_CELLS + rand_y)
+
+    # 2/3 perlin noise and 1/3 worley noise
+    return p_val * 0.66 + (f2 - f1) * 0.33
+
+def generate_eroded_heightmap(position=(0, 0), size=CHUNK_SIZE, rand_x: float = 0.0, rand_y: float = 0.0,
+                              erosion_iterations: int = 0, hydraulic_iterations: int = 0) -> np.ndarray:
+    """generate_heightmap_array followed by hydraulic and then thermal
+    erosion. The rectangle is generated with enough overlap around it that
+    the erosion matches up with the neighboring chunks, then cropped back to
+    `size`.
+    """
+    if erosion_iterations <= 0 and hydraulic_iterations <= 0:
+        return generate_heightmap_array(position, size, rand_x, rand_y)
+
+    halo = thermal_erosion_halo(erosion_iterations) + hydraulic_erosion_halo(hydraulic_iterations)
+    heights = generate_heightmap_array((position[0] - halo, position[1] - halo),
+                                       (size[0] + 2 * halo, size[1] + 2 * halo), rand_x, rand_y)
+    if hydraulic_iterations > 0:
+        heights, _ = hydraulic_erosion_array(heights, hydraulic_iterations)
+    if erosion_iterations > 0:
+        heights, _ = thermal_erosion_array(heights, erosion_iterations)
+    return heights[halo:halo + size[1], halo:halo + size[0]]
+
+def split_into_chunks(heights: np.ndarray, position=(0, 0), chunk_size=CHUNK_SIZE) -> dict:
+    """Slice a block generated by generate_heightmap_array into per-chunk
+    arrays keyed by the chunk's tile coordinate.
+    """
+    chunks = {}
+    for y_off in range(0, heights.shape[0], chunk_size[1]):
+        for x_off in range(0, heights.shape[1], chunk_size[0]):
+            key = (int(position[0]) + x_off, int(position[1]) + y_off)
+            chunks[key] = heights[y_off:y_off + chunk_size[1], x_off:x_off + chunk_size[0]]
+    return chunks
@@ -0,0 +1,47 @@
+import math
+import numpy as np
+
+from globals import WORLD_SIZE, CHUNK_SIZE
+from world_generation.distance import distance_transform
+from world_generation.noise import fBm_noise_array
+
+def chunk_water_distance(water_func, chunk_pos: tuple[int, int], radius: float, metric: str = "manhattan",
+                         chunk_size=CHUNK_SIZE) -> np.ndarray:
+    """Distance from every tile of a chunk to the nearest water, looking
+    `radius` tiles past the edges of the chunk. Distances up to `radius` are
+    exact, anything further is reported as `radius`. Indexed [y][x].
+
+    water_func(chunk_pos) returns which tiles of a chunk are water. It is
+    called for the chunk and every chunk within `radius` of it, so it should
+    be cached.
+    """
+    size_x, size_y = chunk_size
+    reach = math.ceil(radius)
+    reach_x = math.ceil(reach / size_x)
+    reach_y = math.ceil(reach / size_y)
+
+    # Water of the chunk and every chunk within `radius` of it
+    window = np.block([[np.asarray(water_func((chunk_pos[0] + dx * size_x, chunk_pos[1] + dy * size_y)), dtype=bool)
+                        for dx in range(-reach_x, reach_x + 1)]
+                       for dy in range(-reach_y, reach_y + 1)])
+
+    # Only the tiles within `radius` of the chunk matter
+    top = reach_y * size_y - reach
+    left = reach_x * size_x - reach
+    window = window[top:top + size_y + 2 * reach, left:left + size_x + 2 * reach]
+
+    distances = distance_transform(window, metric)
+    return np.minimum(distances[reach:reach + size_y, reach:reach + size_x], radius)
+
+def humidity_field(position, size, water_distance: np.ndarray, radius: float) -> np.ndarray:
+    """Humidity between 0 and 1 of a rectangle of tiles, indexed [y][x].
+    `water_distance` is the distance to the nearest water of every tile, the
+    closer the wetter. Water is rare, so away from it noise alone decides,
+    averaging the two would make almost everything dry.
+    """
+    fx, fy = np.meshgrid(np.arange(int(position[0]), int(position[0]) + size[0]) / WORLD_SIZE[0],
+                         np.arange(int(position[1]), int(position[1]) + size[1]) / WORLD_SIZE[1])
+    humidity_noise = fBm_noise_array(fx, fy, 5, frequency=8.0)
+
+    water_distance = np.minimum(np.asarray(water_distance, dtype=np.float64), radius)
+    return np.maximum(1.0 - water_distance / radius, humidity_noise)
@@ -1,6 +1,6 @@
 import math
-import random
 import pygame
+import numpy as np
 import functools
 
 def sin01(val: float) -> float:
@@ -72,91 +72,63 @@ def fBm_noise(position: pygame.Vector2, octaves: int, amplitude: float = 0.5, fr
 
     return value
 
-def fBm_texture(size=(256, 256), octaves=5, **kwargs):
-    surf = pygame.Surface(size)
-    surf.lock()
-    for x in range(size[0]):
-        for y in range(size[1]):
-            normalized_coords = pygame.Vector2(x / size[0], y / size[1])
-            val = fBm_noise(normalized_coords, octaves, **kwargs)
-            # dist = 0.5
-            # x_offset = math.cos(pval) * dist
-            # y_offset = math.sin(pval) * dist
-            # val = fBm_noise(normalized_coords + pygame.Vector2(x_offset, y_offset), octaves, **kwargs)
-            col = min(255, int(val * 255))
-            surf.set_at((x, y), (col, col, col))
-
-    surf.unlock()
-    return surf
-
-def worley_noise(position: pygame.Vector2, rows: int = 4, cols: int = 4, seed_vec1=pygame.Vector2(127.1,311.7), seed_vec2=pygame.Vector2(269.5,183.3)) -> list:
-    """Based on the implementation in https://thebookofshaders.com/12/, 
-    retreives the distances to the points in the 9 surrounding cells. Not a
-    perfect implementation because it is possible for a coordinate on the
-    edge of a cell to be closer to a point two cells away.
-    
-    position should be a pygame.Vector2 with the x and y coordinates normalized
-    between 0 and 1. Note the vector itself should not be normalized.
-    
+def random1_array(x: np.ndarray, y: np.ndarray, seed_vec=pygame.Vector2(12.9898,78.233)) -> np.ndarray:
+    """Array version of random1. x and y hold the coordinate components."""
+    intermediate = np.sin(x * seed_vec.x + y * seed_vec.y) * 43758.5453123
+    return np.mod(intermediate, 1.0)
+
+def random2_array(x: np.ndarray, y: np.ndarray, seed_vec1=pygame.Vector2(127.1,311.7), seed_vec2=pygame.Vector2(269.5,183.3)) -> tuple[np.ndarray, np.ndarray]:
+    """Array version of random2. Returns the x and y components separately"""
+    intermediate_x = np.sin(x * seed_vec1.x + y * seed_vec1.y) * 43758.5453
+    intermediate_y = np.sin(x * seed_vec2.x + y * seed_vec2.y) * 43758.5453
+    return vec2_components_array(intermediate_x, intermediate_y)[0]
+
+def vec2_components_array(x: np.ndarray, y: np.ndarray) -> tuple[tuple[np.ndarray, np.ndarray], tuple[np.ndarray, np.ndarray]]:
+    """Array version of vec2_components. Returns ((f_x, f_y), (i_x, i_y))"""
+    i_x = np.floor(x)
+    i_y = np.floor(y)
+    return ((x - i_x, y - i_y), (i_x, i_y))
+
+def smooth_noise_array(x: np.ndarray, y: np.ndarray, interpolation_method=quintic_interpolation, seed_vec=pygame.Vector2(12.9898,78.233)) -> np.ndarray:
+    """Array version of smooth_noise. Evaluates every coordinate in x and y at
+    once. interpolation_method is called with whole arrays, so it should only
+    use arithmetic operators (lerp and quintic_interpolation already do).
     """
+    (f_x, f_y), (i_x, i_y) = vec2_components_array(x, y)
+
+    topleft     = random1_array(i_x, i_y, seed_vec)
+    topright    = random1_array(i_x + 1.0, i_y, seed_vec)
+    bottomleft  = random1_array(i_x, i_y + 1.0, seed_vec)
+    bottomright = random1_array(i_x + 1.0, i_y + 1.0, seed_vec)
+
+    u_x = interpolation_method(0.0, 1.0, f_x)
+    u_y = interpolation_method(0.0, 1.0, f_y)
+
+    return lerp(lerp(topleft, topright, u_x), lerp(bottomleft, bottomright, u_x), u_y)
+
+def fBm_noise_array(x: np.ndarray, y: np.ndarray, octaves: int, amplitude: float = 0.5, frequency: float = 1.0, lacunarity: float = 2.0, gain: float = 0.5, **smooth_noise_kwargs) -> np.ndarray:
+    """Array version of fBm_noise"""
+    value = np.zeros(np.broadcast(x, y).shape)
+    for _ in range(octaves):
+        value += amplitude * smooth_noise_array(x * frequency, y * frequency, **smooth_noise_kwargs)
+        frequency *= lacunarity
+        amplitude *= gain
 
-    dists = []
-
-    normalized_coords = position
-    normalized_coords.x *= cols # The x coord should be in the range [0, 4] if there are 4 columns 
-    normalized_coords.y *= rows
-
-    # fractional and integer vector components of the coordinate. The integer
-    # coordinate tells us which cell we are in, and the fractional coordinate
-    # tells us where we are in that cell. 
-    f_st, i_st = vec2_components(normalized_coords)
-
-    # Only look at the surrounding cells
-    for cell_x in range(-1, 2):
-        for cell_y in range(-1, 2):
-            neighbor = pygame.Vector2(cell_x, cell_y)
-
-            # random2 is used to represent the feature point in a given cell
-            r_point = random2(i_st + neighbor, seed_vec1, seed_vec2)
-
-            diff = neighbor + r_point - f_st
-            dist = diff.magnitude_squared() # Magnitude squared for speed up
-            dists.append(dist)
-    
-    # Sort in order of increasing distance
-    dists.sort()
-    return dists
-
-def worley_noise_val(dists: list[float], coefficients: list[float]):
-    """Since Worley noise returns the distances to the 9 surrounding points,
-    a value calculated from it is typically in the form:
-
-    sum(Dn * Cn)
-    
-    coefficients does not have a set size, as the function will combine
-    distances and coefficients based on whichever has fewer members.
+    return value
+
+def normalized_grid(size) -> tuple[np.ndarray, np.ndarray]:
+    """Coordinates of every pixel in a texture of `size`, normalized between
+    0 and 1. The arrays are indexed [x][y] to line up with pygame.surfarray
     """
-    v = 0
-    for Dn, Cn in zip(dists, coefficients):
-        v += Dn * Cn
-    return v
-
-def worley_texture(size=(256, 256), rows=16, cols=16, seed_vec1=pygame.Vector2(127.1,311.7), seed_vec2=pygame.Vector2(269.5,183.3)):
-    surf = pygame.Surface(size)
-    surf.lock()
-    for x in range(size[0]):
-        for y in range(size[1]):
-            normalized_coords = pygame.Vector2(x / size[0], y / size[1])
-            dists = worley_noise(normalized_coords, rows, cols, seed_vec1, seed_vec2)
-
-            v = dists[1] - dists[0]
-            col = min(255, int(v * 255))
-            surf.set_at((x, y), (col, col, col))
-
-    surf.unlock()
+    return np.meshgrid(np.arange(size[0]) / size[0], np.arange(size[1]) / size[1], indexing="ij")
+
+def grayscale_surface(values: np.ndarray) -> pygame.Surface:
+    """Turn an [x][y] array of values between 0 and 1 into a grayscale surface"""
+    col = np.clip((values * 255).astype(np.int64), 0, 255)
+    surf = pygame.Surface(values.shape)
+    pygame.surfarray.blit_array(surf, np.repeat(col[:, :, np.newaxis], 3, axis=2))
     return surf
 
-def random_worley_texture(size=(256, 256), rows=4, cols=4):
-    worley_vec1 = pygame.Vector2(random.uniform(-1000, 1000), random.uniform(-1000, 1000))
-    worley_vec2 = pygame.Vector2(random.uniform(-1000, 1000), random.uniform(-1000, 1000))
-    return worley_texture(size, rows, cols, worley_vec1, worley_vec2)
\ No newline at end of file
+def fBm_texture(size=(256, 256), octaves=5, **kwargs):
+    x, y = normalized_grid(size)
+    return grayscale_surface(fBm_noise_array(x, y, octaves, **kwargs))
@@ -0,0 +1,104 @@
+import math
+import random
+import numpy as np
+
+class Perlin:
+    """Seeded 2D Perlin noise, between -1 and 1 like Ken Perlin's version.
+
+    The permutation and gradient tables are made once from the seed, so the
+    same seed always gives the same noise. The noise repeats every
+    TABLE_SIZE units along both axes. `noise` takes one coordinate and
+    `noise_array` takes whole arrays of them, both give exactly the same
+    values.
+    """
+
+    TABLE_SIZE = 256
+    # Unit gradients keep 2D Perlin noise within +-sqrt(1/2), this stretches it to +-1
+    SCALE = math.sqrt(2)
+
+    def __init__(self, seed):
+        # random.Random hashes str and bytes seeds the same way on every run
+        rng = random.Random(seed)
+
+        permutation = list(range(Perlin.TABLE_SIZE))
+        rng.shuffle(permutation)
+        # Doubled so perm[perm[x] + y] never has to wrap
+        self.perm = permutation * 2
+
+        angles = [rng.uniform(0, 2 * math.pi) for _ in range(Perlin.TABLE_SIZE)]
+        # Already multiplied by SCALE so the corners don't have to be
+        self.grad_x = [math.cos(angle) * Perlin.SCALE for angle in angles]
+        self.grad_y = [math.sin(angle) * Perlin.SCALE for angle in angles]
+
+        self.perm_array = np.array(self.perm, dtype=np.intp)
+        self.grad_x_array = np.array(self.grad_x)
+        self.grad_y_array = np.array(self.grad_y)
+
+    @staticmethod
+    def fade(t):
+        """6t^5 - 15t^4 + 10t^3, works on floats and arrays"""
+        return t * t * t * (t * (t * 6.0 - 15.0) + 10.0)
+
+    def noise(self, x: float, y: float) -> float:
+        x_floor = math.floor(x)
+        y_floor = math.floor(y)
+        f_x = x - x_floor
+        f_y = y - y_floor
+        i_x = x_floor & (Perlin.TABLE_SIZE - 1)
+        i_y = y_floor & (Perlin.TABLE_SIZE - 1)
+
+        perm = self.perm
+        grad_x = self.grad_x
+        grad_y = self.grad_y
+        left = perm[i_x]
+        right = perm[i_x + 1]
+        topleft = perm[left + i_y]
+        topright = perm[right + i_y]
+        bottomleft = perm[left + i_y + 1]
+        bottomright = perm[right + i_y + 1]
+
+        # Dot product of each corner's gradient with the offset from that corner
+        n_topleft = grad_x[topleft] * f_x + grad_y[topleft] * f_y
+        n_topright = grad_x[topright] * (f_x - 1.0) + grad_y[topright] * f_y
+        n_bottomleft = grad_x[bottomleft] * f_x + grad_y[bottomleft] * (f_y - 1.0)
+        n_bottomright = grad_x[bottomright] * (f_x - 1.0) + grad_y[bottomright] * (f_y - 1.0)
+
+        u_x = Perlin.fade(f_x)
+        u_y = Perlin.fade(f_y)
+        top = n_topleft + (n_topright - n_topleft) * u_x
+        bottom = n_bottomleft + (n_bottomright - n_bottomleft) * u_x
+        return top + (bottom - top) * u_y
+
+    def noise_array(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Array version of noise. x and y hold the coordinate components"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        x_floor = np.floor(x)
+        y_floor = np.floor(y)
+        f_x = x - x_floor
+        f_y = y - y_floor
+        i_x = x_floor.astype(np.intp) & (Perlin.TABLE_SIZE - 1)
+        i_y = y_floor.astype(np.intp) & (Perlin.TABLE_SIZE - 1)
+
+        perm = self.perm_array
+        grad_x = self.grad_x_array
+        grad_y = self.grad_y_array
+        left = perm[i_x]
+        right = perm[i_x + 1]
+        topleft = perm[left + i_y]
+        topright = perm[right + i_y]
+        bottomleft = perm[left + i_y + 1]
+        bottomright = perm[right + i_y + 1]
+
+        f_x1 = f_x - 1.0
+        f_y1 = f_y - 1.0
+        n_topleft = grad_x[topleft] * f_x + grad_y[topleft] * f_y
+        n_topright = grad_x[topright] * f_x1 + grad_y[topright] * f_y
+        n_bottomleft = grad_x[bottomleft] * f_x + grad_y[bottomleft] * f_y1
+        n_bottomright = grad_x[bottomright] * f_x1 + grad_y[bottomright] * f_y1
+
+        u_x = Perlin.fade(f_x)
+        u_y = Perlin.fade(f_y)
+        top = n_topleft + (n_topright - n_topleft) * u_x
+        bottom = n_bottomleft + (n_bottomright - n_bottomleft) * u_x
+        return top + (bottom - top) * u_y
@@ -0,0 +1,185 @@
+from collections import OrderedDict, deque
+import heapq
+import math
+import numpy as np
+
+# Offsets of the 8 neighbors as (row, column), and how far away each one is
+D8_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+D8_DISTANCES = [math.hypot(row, col) for row, col in D8_OFFSETS]
+
+def priority_flood_fill(heights: np.ndarray, outlets: np.ndarray | None = None, epsilon: float = 1e-7) -> np.ndarray:
+    """Raise every depression in `heights` until water can flow out of it,
+    either off the edge of the array or into one of the `outlets`. Filled
+    areas keep a slope of `epsilon` per tile towards the way out, so every
+    tile ends up with a lower neighbor to flow to.
+
+    This is the Priority-Flood+epsilon of Barnes, Lehman and Mulla (2014):
+    the edges and outlets go in a priority queue, and the lowest tile in it
+    claims all of its unclaimed neighbors. Neighbors that have to be raised
+    go in a plain queue instead, which is cheaper.
+    """
+    rows, cols = heights.shape
+    # A ring of already claimed tiles around the array saves checking for the edges
+    width = cols + 2
+    filled = np.full((rows + 2, width), -np.inf)
+    filled[1:-1, 1:-1] = heights
+    claimed = np.ones((rows + 2, width), dtype=bool)
+    claimed[1:-1, 1:-1] = False
+
+    seeds = np.zeros((rows, cols), dtype=bool)
+    seeds[[0, -1], :] = True
+    seeds[:, [0, -1]] = True
+    if outlets is not None:
+        seeds |= outlets
+    seed_rows, seed_cols = np.nonzero(seeds)
+    seed_indices = (seed_rows + 1) * width + seed_cols + 1
+
+    values = filled.ravel().tolist()
+    claimed_flat = bytearray(claimed.ravel().tobytes())
+    for index in seed_indices.tolist():
+        claimed_flat[index] = 1
+    open_queue = [(values[index], index) for index in seed_indices.tolist()]
+    heapq.heapify(open_queue)
+    pit = deque()
+    neighbor_offsets = [row * width + col for row, col in D8_OFFSETS]
+    # Looked up once, this loop runs for every tile
+    heappush, heappop, pit_append, pit_pop = heapq.heappush, heapq.heappop, pit.append, pit.popleft
+
+    while open_queue or pit:
+        if pit:
+            index = pit_pop()
+            value = values[index]
+        else:
+            value, index = heappop(open_queue)
+
+        raised = value + epsilon
+        for offset in neighbor_offsets:
+            neighbor = index + offset
+            if claimed_flat[neighbor]:
+                continue
+            claimed_flat[neighbor] = 1
+            if values[neighbor] <= raised:
+                values[neighbor] = raised
+                pit_append(neighbor)
+            else:
+                heappush(open_queue, (values[neighbor], neighbor))
+
+    return np.array(values).reshape(rows + 2, width)[1:-1, 1:-1]
+
+def flow_directions(filled: np.ndarray, outlets: np.ndarray | None = None) -> np.ndarray:
+    """D8 flow direction of every tile: the flat index of the neighbor with
+    the steepest drop, or -1 for tiles with no lower neighbor and outlets.
+    """
+    rows, cols = filled.shape
+    padded = np.full((rows + 2, cols + 2), np.inf)
+    padded[1:-1, 1:-1] = filled
+
+    slopes = np.stack([(filled - padded[1 + row:1 + row + rows, 1 + col:1 + col + cols]) / distance
+                       for (row, col), distance in zip(D8_OFFSETS, D8_DISTANCES)])
+    steepest = slopes.argmax(axis=0)
+
+    row_offsets = np.array([row for row, _ in D8_OFFSETS])
+    col_offsets = np.array([col for _, col in D8_OFFSETS])
+    index_rows, index_cols = np.indices((rows, cols))
+    directions = (index_rows + row_offsets[steepest]) * cols + index_cols + col_offsets[steepest]
+
+    no_drop = np.take_along_axis(slopes, steepest[None], axis=0)[0] <= 0
+    if outlets is not None:
+        no_drop |= outlets
+    directions[no_drop] = -1
+    return directions
+
+def flow_accumulation(filled: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    """How many tiles drain through every tile, itself included. Water only
+    flows downhill, so going from the highest tile to the lowest every tile
+    has received everything from upstream before it passes it on.
+    """
+    accumulation = [1] * filled.size
+    downstream = directions.ravel().tolist()
+    for index in np.argsort(filled.ravel(), kind="stable")[::-1].tolist():
+        target = downstream[index]
+        if target >= 0:
+            accumulation[target] += accumulation[index]
+    return np.array(accumulation).reshape(filled.shape)
+
+class RiverNetwork:
+    """Where the rivers are, worked out a region at a time.
+
+    Every region is `region_size` tiles with `halo` tiles of the terrain
+    around it included, so rivers flow on across region edges and chunks
+    never have to wait on the rest of the world. Only the part of a river's
+    catchment inside the halo counts though. Where a river's catchment goes
+    further than that, the regions on either side of an edge disagree, and
+    the river ends or starts right at the edge. The halo has to be about as
+    wide as the catchments of the terrain, see river_seams in benchmark.py.
+    Finished regions are kept in a least recently used cache of
+    `max_regions`. Regions worked out somewhere else, like another process,
+    can be handed over with `put`.
+    """
+
+    def __init__(self, heights_func, min_flow: int, region_size: tuple[int, int], halo: int,
+                 water_height: float = 0.25, max_regions: int = 16):
+        # heights_func(position, size) returns the heights of that rectangle of tiles, indexed [y][x]
+        self.heights_func = heights_func
+        self.min_flow = min_flow
+        self.region_size = region_size
+        self.halo = halo
+        self.water_height = water_height
+        self.max_regions = max_regions
+        self._regions = OrderedDict() # region key -> river mask
+
+    def get_region_key(self, coord) -> tuple[int, int]:
+        return (int(coord[0] // self.region_size[0] * self.region_size[0]),
+                int(coord[1] // self.region_size[1] * self.region_size[1]))
+
+    def region_keys(self, position, size) -> list[tuple[int, int]]:
+        """The regions a rectangle of tiles overlaps"""
+        left, top = self.get_region_key(position)
+        return [(region_x, region_y)
+                for region_y in range(top, int(position[1]) + size[1], self.region_size[1])
+                for region_x in range(left, int(position[0]) + size[0], self.region_size[0])]
+
+    def contains(self, key: tuple[int, int]) -> bool:
+        return key in self._regions
+
+    def put(self, key: tuple[int, int], rivers: np.ndarray) -> None:
+        self._regions[key] = rivers
+        self._regions.move_to_end(key)
+        while len(self._regions) > self.max_regions:
+            self._regions.popitem(last=False)
+
+    def region(self, key: tuple[int, int]) -> np.ndarray:
+        """River mask of the region with its top left tile at `key`"""
+        if key in self._regions:
+            self._regions.move_to_end(key)
+            return self._regions[key]
+
+        rivers = self.compute_region(key)
+        self.put(key, rivers)
+        return rivers
+
+    def compute_region(self, key: tuple[int, int]) -> np.ndarray:
+        """River mask of a region, without looking in the cache"""
+        halo = self.halo
+        size_x, size_y = self.region_size
+        heights = np.asarray(self.heights_func((key[0] - halo, key[1] - halo), (size_x + 2 * halo, size_y + 2 * halo)),
+                             dtype=np.float64)
+        # Rivers end where they reach the sea
+        water = heights < self.water_height
+
+        filled = priority_flood_fill(heights, water)
+        accumulation = flow_accumulation(filled, flow_directions(filled, water))
+        rivers = (accumulation >= self.min_flow) & ~water
+        return rivers[halo:halo + size_y, halo:halo + size_x]
+
+    def mask(self, position, size) -> np.ndarray:
+        """Which tiles of a rectangle are rivers, indexed [y][x]"""
+        left, top = int(position[0]), int(position[1])
+        mask = np.zeros((size[1], size[0]), dtype=bool)
+        for region_x, region_y in self.region_keys((left, top), size):
+            rivers = self.region((region_x, region_y))
+            # Overlap of the region and the rectangle, in tiles
+            x0, x1 = max(left, region_x), min(left + size[0], region_x + self.region_size[0])
+            y0, y1 = max(top, region_y), min(top + size[1], region_y + self.region_size[1])
+            mask[y0 - top:y1 - top, x0 - left:x1 - left] = rivers[y0 - region_y:y1 - region_y, x0 - region_x:x1 - region_x]
+        return mask
@@ -0,0 +1,28 @@
+import numpy as np
+
+from globals import WORLD_SIZE
+from world_generation.heightmap import terrain_perlin
+
+# Higher = smaller warm and cold regions
+TEMPERATURE_SCALE = 2.0
+# Where in the noise the temperature is read from, far enough from the terrain to not line up with it
+TEMPERATURE_OFFSET = 128.0
+# How much colder it gets per unit of height above the lowlands
+TEMPERATURE_LAPSE = 0.5
+LOWLAND_HEIGHT = 0.3
+
+def temperature_field(position, size, heights: np.ndarray, rand_x: float, rand_y: float) -> np.ndarray:
+    """Temperature between 0 (freezing) and 1 (hot) of a rectangle of tiles,
+    indexed [y][x]. Large smooth warm and cold regions from the terrain's
+    Perlin noise, getting colder the higher up a tile is.
+    """
+    perlin = terrain_perlin(rand_x, rand_y)
+    x, y = np.meshgrid(np.arange(int(position[0]), int(position[0]) + size[0]) / WORLD_SIZE[0] * TEMPERATURE_SCALE,
+                       np.arange(int(position[1]), int(position[1]) + size[1]) / WORLD_SIZE[1] * TEMPERATURE_SCALE)
+    x += rand_x + TEMPERATURE_OFFSET
+    y += rand_y + TEMPERATURE_OFFSET
+
+    climate = (perlin.noise_array(x, y) + 0.5 * perlin.noise_array(x * 2, y * 2)) / 1.5
+    temperature = 0.5 + 0.5 * climate
+    temperature -= np.maximum(np.asarray(heights, dtype=np.float64) - LOWLAND_HEIGHT, 0.0) * TEMPERATURE_LAPSE
+    return np.clip(temperature, 0.0, 1.0)